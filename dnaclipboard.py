@@ -12,11 +12,12 @@ import dbus.mainloop.glib
 from PySide import QtGui
 
 from dnatools import *
+import meltframe
 from pyfold import MeltingConditions
 from pyfold import MTask
 
 UNAFOLD_PATH = ''
-RAM_DISK = '/home/kablag/.ramdisk/'
+RAM_DISK = None
 
 A_CONC = 2e-7
 C_10 = A_CONC * 0.1
@@ -90,21 +91,9 @@ class SeqLine(QtGui.QWidget):
         mtask = MTask(self.seqEdit.text())
         mtask.execute(M_CONDS)
         # self.connection.send(mtask)
-        plots = [{'action': 'add_graph',
-                            'a': mpot.a,
-                            'b': mpot.b,
-                            'length': mpot.length_of_a,
-                            'gc%': mpot.gc_of_a,
-                            't10': mpot.t10,
-                            't90': mpot.t90,
-                            'mpoints': mpot.mpoints_as_XY,
-                            'color': 'rnd',
-                            'marker': 'rnd',
-                            }
-                 for mpot in mtask.melting_pots]
-        messages = [yaml.dump({'plots':[plot]}) for plot in plots]
+        plots = [mpot_plot(mpot) for mpot in mtask.melting_pots]
         self.connect_to_meltviewer()
-        self.iface.sendPlot(messages[0])
+        self.iface.sendFrames(dbus.ByteArray(meltframe.encode(plots)))
 
     def setSequence(self, sequence):
         self.seqEdit.setText(sequence)
@@ -0,0 +1,17 @@
+__author__ = 'kablag'
+
+def reverse_complement(sequence: str):
+    return complement(reverse(sequence))
+
+def reverse(sequence: str):
+    return sequence[::-1]
+
+def complement(sequence: str):
+    table = "".maketrans("ATGCatgcRYMKSWBDHVNrymkswbdhvn", "TACGtacgYRKMSWVHDBNyrkmswvhdbn")
+    return sequence.translate(table)
+
+def calcGC(sequence: str):
+    sequence = sequence.lower()
+    at = sequence.count('a') + sequence.count('t')
+    gc = sequence.count('g') + sequence.count('c')
+    return (gc / (at + gc)) * 100
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import array
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+EVICT_TO = 0.9
+EVICT_CHECK_EVERY = 64
+
+
+def conditions_key(conditions):
+    return {'unafold_path': conditions.unafold_path,
+            't_min': float(conditions.t_min),
+            't_max': float(conditions.t_max),
+            't_increment': float(conditions.t_increment),
+            'a_conc': float(conditions.a_conc),
+            'Na_conc': float(conditions.Na_conc),
+            'Mg_conc': float(conditions.Mg_conc),}
+
+
+def melt_key(backend, conditions, seq_a, seq_b):
+    payload = json.dumps([backend.name,
+                          backend.version,
+                          seq_a,
+                          seq_b,
+                          conditions_key(conditions)],
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# conditions each UNAFold stage reads: hybrid-ss and hybrid fold and
+# hybridize without knowing the strand concentration, only concentration
+# (with sbs) does
+STAGE_CONDITIONS = {'hybrid-ss': ('unafold_path', 't_min', 't_max',
+                                  't_increment', 'Na_conc', 'Mg_conc'),
+                    'hybrid': ('unafold_path', 't_min', 't_max',
+                               't_increment', 'Na_conc', 'Mg_conc'),
+                    'concentration': ('unafold_path', 't_min', 't_max',
+                                      't_increment', 'a_conc', 'Na_conc',
+                                      'Mg_conc'),}
+
+
+def stage_key(stage, conditions, *seqs):
+    key = conditions_key(conditions)
+    payload = json.dumps([stage,
+                          list(seqs),
+                          {field: key[field]
+                           for field in STAGE_CONDITIONS[stage]}],
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def pack_curve(x, y):
+    return array.array('d', x).tobytes() + array.array('d', y).tobytes()
+
+
+def unpack_curve(blob):
+    values = array.array('d')
+    values.frombytes(blob)
+    half = len(values) // 2
+    return values[:half].tolist(), values[half:].tolist()
+
+
+class MeltCache():
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, timeout=30.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.__timeout = timeout
+        self.__local = threading.local()
+        self.__puts = 0
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        db = self.__db()
+        db.execute('CREATE TABLE IF NOT EXISTS melts ('
+                   'key TEXT PRIMARY KEY, '
+                   'curve BLOB NOT NULL, '
+                   't10 REAL, '
+                   't90 REAL, '
+                   'size INTEGER NOT NULL, '
+                   'accessed REAL NOT NULL)')
+        db.execute('CREATE INDEX IF NOT EXISTS melts_accessed '
+                   'ON melts (accessed)')
+        db.execute('CREATE TABLE IF NOT EXISTS artifacts ('
+                   'key TEXT PRIMARY KEY, '
+                   'data BLOB NOT NULL, '
+                   'size INTEGER NOT NULL, '
+                   'accessed REAL NOT NULL)')
+        db.execute('CREATE INDEX IF NOT EXISTS artifacts_accessed '
+                   'ON artifacts (accessed)')
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_MeltCache__local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__local = threading.local()
+
+    def __db(self):
+        db = getattr(self.__local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path,
+                                 timeout=self.__timeout,
+                                 isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.__local.db = db
+        return db
+
+    def get(self, key):
+        db = self.__db()
+        row = db.execute('SELECT curve, t10, t90 FROM melts WHERE key = ?',
+                         (key,)).fetchone()
+        if row is None:
+            return None
+        db.execute('UPDATE melts SET accessed = ? WHERE key = ?',
+                   (time.time(), key))
+        x, y = unpack_curve(row[0])
+        return x, y, row[1], row[2]
+
+    def put(self, key, x, y, t10=None, t90=None):
+        blob = pack_curve(x, y)
+        self.__db().execute('INSERT OR REPLACE INTO melts '
+                            '(key, curve, t10, t90, size, accessed) '
+                            'VALUES (?, ?, ?, ?, ?, ?)',
+                            (key, blob, t10, t90,
+                             len(blob) + len(key), time.time()))
+        self.__put_done()
+
+    def get_artifact(self, key):
+        db = self.__db()
+        row = db.execute('SELECT data FROM artifacts WHERE key = ?',
+                         (key,)).fetchone()
+        if row is None:
+            return None
+        db.execute('UPDATE artifacts SET accessed = ? WHERE key = ?',
+                   (time.time(), key))
+        return bytes(row[0])
+
+    def put_artifact(self, key, data):
+        self.__db().execute('INSERT OR REPLACE INTO artifacts '
+                            '(key, data, size, accessed) '
+                            'VALUES (?, ?, ?, ?)',
+                            (key, data, len(data) + len(key), time.time()))
+        self.__put_done()
+
+    def __put_done(self):
+        self.__puts += 1
+        if self.__puts % EVICT_CHECK_EVERY == 0:
+            self.evict()
+
+    def size(self):
+        return self.__db().execute(
+            'SELECT (SELECT COALESCE(SUM(size), 0) FROM melts) + '
+            '(SELECT COALESCE(SUM(size), 0) FROM artifacts)').fetchone()[0]
+
+    def evict(self):
+        db = self.__db()
+        total = self.size()
+        if total <= self.max_bytes:
+            return 0
+        excess = total - self.max_bytes * EVICT_TO
+        evicted = 0
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            for table, key, size in db.execute(
+                    "SELECT 'melts', key, size, accessed FROM melts "
+                    "UNION ALL "
+                    "SELECT 'artifacts', key, size, accessed FROM artifacts "
+                    "ORDER BY accessed").fetchall():
+                if excess <= 0:
+                    break
+                db.execute('DELETE FROM {table} WHERE key = ?'.format(
+                    table=table), (key,))
+                excess -= size
+                evicted += 1
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return evicted
+
+    def clear(self):
+        self.__db().execute('DELETE FROM melts')
+        self.__db().execute('DELETE FROM artifacts')
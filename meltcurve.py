@@ -0,0 +1,152 @@
+import warnings
+
+import numpy as np
+
+
+class ConcParsingError(Exception):
+    pass
+
+
+def calc_t_at_levels(temperatures, concs, levels):
+    # temperatures: (n_t,) common grid, concs: (n_curves, n_t),
+    # levels: (n_levels,) concentrations; returns (n_curves, n_levels)
+    # with the first crossing of each level and NaN where it is not crossed
+    t = np.asarray(temperatures, dtype=float)
+    c = np.atleast_2d(np.asarray(concs, dtype=float))
+    level = np.asarray(levels, dtype=float)[:, None, None]
+    if c.shape[1] < 2:
+        return np.full((c.shape[0], level.shape[0]), np.nan)
+    c0, c1 = c[None, :, :-1], c[None, :, 1:]
+    crossed = ((c0 - level) * (c1 - level) <= 0) & (c0 != c1)
+    found = crossed.any(axis=2)
+    first = crossed.argmax(axis=2)
+    rows = np.arange(c.shape[0])[None, :]
+    lo = c[rows, first]
+    hi = c[rows, first + 1]
+    t_lo = t[first]
+    t_hi = t[first + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = t_lo + (t_hi - t_lo) * (level[:, :, 0] - lo) / (hi - lo)
+    result[~found] = np.nan
+    return result.T
+
+
+def calc_t_at_fractions(temperatures, concs, fractions, total):
+    return calc_t_at_levels(temperatures, concs,
+                            np.asarray(fractions, dtype=float) * total)
+
+
+class MPoint():
+    def __init__(self, t, conc):
+        self.t = t
+        self.conc = conc
+
+    def __repr__(self):
+        return 't = {t}\tC = {c}'.format(t=self.t, c=self.conc)
+
+
+class MeltCurve():
+    __slots__ = ('__data',)
+
+    def __init__(self, t=(), conc=()):
+        self.__data = np.array([np.asarray(t, dtype=float),
+                                np.asarray(conc, dtype=float)])
+        if self.__data.ndim != 2:
+            self.__data = np.empty((2, 0))
+
+    @classmethod
+    def from_array(cls, data):
+        curve = cls.__new__(cls)
+        curve.__data = data
+        return curve
+
+    @classmethod
+    def from_mpoints(cls, mpoints):
+        return cls([mpoint.t for mpoint in mpoints],
+                   [mpoint.conc for mpoint in mpoints])
+
+    @property
+    def data(self):
+        return self.__data
+
+    @property
+    def t(self):
+        return self.__data[0]
+
+    @property
+    def conc(self):
+        return self.__data[1]
+
+    @property
+    def as_XY(self):
+        return self.__data[0], self.__data[1]
+
+    def tolist(self):
+        return self.__data[0].tolist(), self.__data[1].tolist()
+
+    def __len__(self):
+        return self.__data.shape[1]
+
+    def __iter__(self):
+        for t, conc in self.__data.T.tolist():
+            yield MPoint(t, conc)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return MeltCurve.from_array(self.__data[:, index])
+        t, conc = self.__data[:, index].tolist()
+        return MPoint(t, conc)
+
+    def __repr__(self):
+        return 'MeltCurve({n} points)'.format(n=len(self))
+
+
+def parse_conc(f, expected_rows=None, source='.conc'):
+    # f: binary file object at the start of a .conc file; the body goes
+    # straight into numpy's text loader, no per value Python objects
+    header = f.readline()
+    if not header:
+        raise ConcParsingError('{source}: empty file'.format(source=source))
+    columns = header.rstrip(b'\r\n').split(b'\t')
+    if len(columns) < 2:
+        raise ConcParsingError('{source}: bad header {header!r}'.format(
+            source=source, header=header))
+    try:
+        float(columns[0])
+    except ValueError:
+        pass
+    else:
+        raise ConcParsingError('{source}: header is missing'.format(
+            source=source))
+    try:
+        with warnings.catch_warnings():
+            # an empty body is reported below
+            warnings.simplefilter('ignore', UserWarning)
+            values = np.loadtxt(f, dtype=float, ndmin=2)
+    except ValueError as error:
+        raise ConcParsingError('{source}: {error}'.format(source=source,
+                                                          error=error))
+    rows = values.shape[0]
+    if rows == 0 or values.shape[1] != len(columns):
+        raise ConcParsingError(
+            '{source}: {n} values for {rows} rows of {cols} columns'.format(
+                source=source, n=values.size, rows=rows, cols=len(columns)))
+    if expected_rows is not None and rows != expected_rows:
+        raise ConcParsingError(
+            '{source}: {rows} rows, expected {expected}'.format(
+                source=source, rows=rows, expected=expected_rows))
+    return MeltCurve.from_array(np.array([values[:, 0], values[:, -1]]))
+
+
+def read_conc(path, expected_rows=None):
+    with open(path, 'rb') as f:
+        return parse_conc(f, expected_rows, path)
+
+
+def merge_curves(coarse, fine):
+    # fine points replace the coarse ones inside the fine temperature range
+    outside = (coarse.t < fine.t[0]) | (coarse.t > fine.t[-1])
+    t = np.concatenate([coarse.t[outside], fine.t])
+    conc = np.concatenate([coarse.conc[outside], fine.conc])
+    order = np.argsort(t, kind='stable')
+    return MeltCurve.from_array(np.array([t[order], conc[order]]))
@@ -0,0 +1,170 @@
+import json
+import random
+import struct
+import collections
+
+import numpy as np
+
+# Frame: MAGIC, HEADER (version, metadata length, data length), JSON list of
+# plot metadata, zero padding to ALIGN, then every plot's (2, points) float64
+# t/conc block in metadata order. Frames carry their own length, so several
+# can be concatenated into one message.
+MAGIC = b'MELTFRM\n'
+VERSION = 1
+HEADER = struct.Struct('<IIQ')
+ALIGN = 8
+# largest UDP payload over IPv4
+DATAGRAM_SIZE = 65507
+# A frame too big for one datagram (a single huge curve) travels as
+# fragments: FRAGMENT_MAGIC, FRAGMENT (message id, index, count), bytes.
+FRAGMENT_MAGIC = b'MELTFRG\n'
+FRAGMENT = struct.Struct('<QII')
+# incomplete fragmented messages a Reassembler keeps before dropping
+# the oldest
+PENDING_MESSAGES = 16
+
+
+class FrameError(Exception):
+    pass
+
+
+def aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def plot_arrays(plots):
+    return [np.ascontiguousarray(plot['mpoints'], dtype='<f8').reshape(2, -1)
+            for plot in plots]
+
+
+def plot_meta(plot, points):
+    meta = {key: value for key, value in plot.items() if key != 'mpoints'}
+    meta['points'] = points
+    return meta
+
+
+def encode(plots):
+    # plots: dicts as sent to meltviewer, 'mpoints' a (t, conc) pair
+    arrays = plot_arrays(plots)
+    meta = json.dumps([plot_meta(plot, array.shape[1])
+                       for plot, array in zip(plots, arrays)]).encode()
+    data = b''.join(array.tobytes() for array in arrays)
+    start = len(MAGIC) + HEADER.size + len(meta)
+    return b''.join([MAGIC,
+                     HEADER.pack(VERSION, len(meta), len(data)),
+                     meta,
+                     b'\0' * (aligned(start) - start),
+                     data])
+
+
+def frame_size(meta_len, data_len):
+    return aligned(len(MAGIC) + HEADER.size + meta_len) + data_len
+
+
+def fragments(frame, max_size=DATAGRAM_SIZE):
+    chunk = max_size - len(FRAGMENT_MAGIC) - FRAGMENT.size
+    if chunk <= 0:
+        raise FrameError('{max_size} bytes leave no room for data'.format(
+            max_size=max_size))
+    message = random.getrandbits(64)
+    count = -(-len(frame) // chunk)
+    for index in range(count):
+        yield b''.join([FRAGMENT_MAGIC,
+                        FRAGMENT.pack(message, index, count),
+                        frame[index * chunk:(index + 1) * chunk]])
+
+
+def frames(plots, max_size=DATAGRAM_SIZE):
+    # datagrams of at most max_size bytes: plots batched into as few frames
+    # as possible, a plot too big for a frame of its own is fragmented
+    batch = []
+    meta_len = data_len = 0
+    for plot, array in zip(plots, plot_arrays(plots)):
+        # upper bound of what the plot adds to the metadata: its JSON, the
+        # list separator (or the brackets)
+        plot_meta_len = len(json.dumps(plot_meta(plot, array.shape[1]))) + 2
+        if frame_size(plot_meta_len, array.nbytes) > max_size:
+            if batch:
+                yield encode(batch)
+                batch = []
+                meta_len = data_len = 0
+            yield from fragments(encode([plot]), max_size)
+            continue
+        if batch and frame_size(meta_len + plot_meta_len,
+                                data_len + array.nbytes) > max_size:
+            yield encode(batch)
+            batch = []
+            meta_len = data_len = 0
+        batch.append(plot)
+        meta_len += plot_meta_len
+        data_len += array.nbytes
+    if batch:
+        yield encode(batch)
+
+
+class Reassembler():
+    # Turns datagrams from frames() back into plots, holding fragments
+    # until their message is complete.
+    def __init__(self, pending=PENDING_MESSAGES):
+        self.pending = pending
+        self.__messages = collections.OrderedDict()
+
+    def feed(self, datagram):
+        datagram = bytes(datagram)
+        if not datagram.startswith(FRAGMENT_MAGIC):
+            return decode(datagram)
+        start = len(FRAGMENT_MAGIC)
+        if len(datagram) < start + FRAGMENT.size:
+            raise FrameError('truncated fragment header')
+        message, index, count = FRAGMENT.unpack_from(datagram, start)
+        if index >= count:
+            raise FrameError('fragment {index} of {count}'.format(
+                index=index, count=count))
+        parts = self.__messages.setdefault(message, {})
+        parts[index] = datagram[start + FRAGMENT.size:]
+        if len(parts) < count:
+            while len(self.__messages) > self.pending:
+                self.__messages.popitem(last=False)
+            return []
+        del self.__messages[message]
+        return decode(b''.join(parts[index] for index in range(count)))
+
+
+def decode(data):
+    # plots of every frame in data, 'mpoints' are (t, conc) arrays viewing
+    # data without a copy
+    data = memoryview(data).cast('B')
+    plots = []
+    offset = 0
+    while offset < len(data):
+        if bytes(data[offset:offset + len(MAGIC)]) != MAGIC:
+            raise FrameError('not a melt frame at byte {offset}'.format(
+                offset=offset))
+        start = offset + len(MAGIC)
+        if len(data) < start + HEADER.size:
+            raise FrameError('truncated frame header')
+        version, meta_len, data_len = HEADER.unpack_from(data, start)
+        if version > VERSION:
+            raise FrameError('frame version {version} is newer than '
+                             '{supported}'.format(version=version,
+                                                  supported=VERSION))
+        start += HEADER.size
+        base = offset + aligned(start - offset + meta_len)
+        if len(data) < base + data_len:
+            raise FrameError('truncated frame, {missing} bytes missing'.format(
+                missing=base + data_len - len(data)))
+        meta = json.loads(bytes(data[start:start + meta_len]).decode())
+        values = np.frombuffer(data, dtype='<f8', count=data_len // 8,
+                               offset=base)
+        position = 0
+        for plot in meta:
+            points = plot.pop('points')
+            plot['mpoints'] = values[position:position + 2 * points] \
+                .reshape(2, points)
+            position += 2 * points
+            plots.append(plot)
+        if position * 8 != data_len:
+            raise FrameError('{n} bytes of curves for {expected}'.format(
+                n=data_len, expected=position * 8))
+        offset = base + data_len
+    return plots
@@ -19,9 +19,12 @@ from matplotlib.figure import Figure
 
 from PySide import QtCore
 from PySide import QtGui
+from PySide import QtNetwork
 
 
 from pyfold import MTask
+from dnatools import VIEWER_PORT
+import meltframe
 
 COLORS        = 'bgrcmyk'
 MARKERS       = '.ovDs*x'
@@ -55,6 +58,8 @@ class MeltingPlot():
                             if plot_yaml['marker'] != 'rnd' \
                             else MARKERS[randrange(len(MARKERS) - 1)]
         self.show = True
+        # the Line2D drawing this plot, kept for the plot's lifetime
+        self.line = None
 
 class MatplotlibWidget(FigureCanvas):
     def __init__(self, parent=None,xlabel='x',
@@ -118,6 +123,7 @@ class DBusWidget(dbus.service.Object):
     # class InnerDbus(dbus.service.Sequence)
     class DBusInterlayer(QtCore.QObject):
         plotReceived = QtCore.Signal(str)
+        framesReceived = QtCore.Signal(object)
 
         def __init__(self):
             QtCore.QObject.__init__(self)
@@ -131,6 +137,12 @@ class DBusWidget(dbus.service.Object):
     def sendPlot(self, value):
         self.interlayer.plotReceived.emit(value)
 
+    @dbus.service.method('com.meltviewer.Graph', in_signature='ay',
+                         out_signature='', byte_arrays=True)
+    def sendFrames(self, value):
+        # meltframe frames, possibly several concatenated
+        self.interlayer.framesReceived.emit(bytes(value))
+
     # plotReceived = QtCore.Signal(str)
 
 # class Meltviewer(QtGui.QWidget):
@@ -140,6 +152,7 @@ class Meltviewer(QtGui.QWidget):
         # self.plots = ()
         self.melting_plots = []
         self.initDbus(bus)
+        self.initUdp()
         self.init_ui()
 
     def init_ui(self):
@@ -168,11 +181,42 @@ class Meltviewer(QtGui.QWidget):
     def initDbus(self, bus):
         dbusw = DBusWidget(bus)
         dbusw.interlayer.plotReceived.connect(self.on_dbusPlot_received)
+        dbusw.interlayer.framesReceived.connect(self.on_frames_received)
+
+    def initUdp(self):
+        # MeltviewerConnector broadcasts meltframe datagrams
+        self.reassembler = meltframe.Reassembler()
+        self.udp_socket = QtNetwork.QUdpSocket(self)
+        self.udp_socket.bind(VIEWER_PORT,
+                             QtNetwork.QUdpSocket.ShareAddress |
+                             QtNetwork.QUdpSocket.ReuseAddressHint)
+        self.udp_socket.readyRead.connect(self.on_datagrams_ready)
+
+    @QtCore.Slot()
+    def on_datagrams_ready(self):
+        plots = []
+        while self.udp_socket.hasPendingDatagrams():
+            data, host, port = self.udp_socket.readDatagram(
+                self.udp_socket.pendingDatagramSize())
+            try:
+                plots += self.reassembler.feed(data.data())
+            except meltframe.FrameError as error:
+                print('{host}: {error}'.format(host=host.toString(),
+                                               error=error), file=sys.stderr)
+        self.add_plots(plots)
+
+    @QtCore.Slot(object)
+    def on_frames_received(self, data):
+        self.add_plots(meltframe.decode(data))
 
     @QtCore.Slot(str)
     def on_dbusPlot_received(self, text):
-        text_yaml = yaml.load(text)
-        for plot_yaml in text_yaml['plots']:
+        self.add_plots(yaml.safe_load(text)['plots'])
+
+    def add_plots(self, plots):
+        if not plots:
+            return
+        for plot_yaml in plots:
             if plot_yaml['action'] == 'add_graph':
                 # color = plot_yaml['color'] \
                 #     if plot_yaml['color'] != 'rnd' \
@@ -184,9 +228,11 @@ class Meltviewer(QtGui.QWidget):
                     MeltingPlot(plot_yaml)
                 )
                 # self.add_plot(plot_yaml['mpoints'], color, marker)
+                self.add_line(
+                    self.melting_plots[len(self.melting_plots) - 1])
                 self.add_row(
                     self.melting_plots[len(self.melting_plots) - 1])
-        self.redraw_plots()
+        self.rescale_plots()
 
     def add_plot(self, dots, color, marker):
         dots += (color + marker + '-',)
@@ -197,14 +243,18 @@ class Meltviewer(QtGui.QWidget):
         self.data_plot.draw()
         self.show()
 
-    def redraw_plots(self):
-        self.data_plot.axes.clear()
-        for mplot in self.melting_plots:
-            if not mplot.show: continue
-            self.data_plot.axes.plot(mplot.mpoints[0],mplot.mpoints[1],
-                     mplot.color + mplot.marker + '-')
-        self.data_plot.draw()
-        self.show()
+    def add_line(self, mplot):
+        mplot.line, = self.data_plot.axes.plot(
+            mplot.mpoints[0], mplot.mpoints[1],
+            mplot.color + mplot.marker + '-')
+        mplot.line.set_visible(mplot.show)
+
+    def rescale_plots(self):
+        # limits follow the shown curves; artists are only updated, never
+        # rebuilt, and the canvas repaints once when the event loop is idle
+        self.data_plot.axes.relim(visible_only=True)
+        self.data_plot.axes.autoscale_view()
+        self.data_plot.draw_idle()
 
     def add_row(self, mplot):
         self.data_table.setSortingEnabled(False)
@@ -254,17 +304,25 @@ class Meltviewer(QtGui.QWidget):
             state = cell.checkState()
             id = int(self.data_table.item(cell.row(),
                                           COLUMNS.ID.value).text())
-            self.melting_plots[id].show = state
+            mplot = self.melting_plots[id]
+            mplot.show = state == QtCore.Qt.Checked
+            mplot.line.set_visible(mplot.show)
 
-            self.redraw_plots()
+            self.rescale_plots()
 
     def color_changed(self, id, color):
-        self.melting_plots[id].color = color
-        self.redraw_plots()
+        mplot = self.melting_plots[id]
+        mplot.color = color
+        if mplot.line is not None:
+            mplot.line.set_color(color)
+            self.data_plot.draw_idle()
 
     def marker_changed(self, id, marker):
-        self.melting_plots[id].marker = marker
-        self.redraw_plots()
+        mplot = self.melting_plots[id]
+        mplot.marker = marker
+        if mplot.line is not None:
+            mplot.line.set_marker(marker)
+            self.data_plot.draw_idle()
 
 
 def main():
@@ -0,0 +1,260 @@
+import math
+from functools import lru_cache
+
+# Nearest-neighbor two-state melting model used as an in-process
+# alternative to the UNAFold hybrid/hybrid-ss/concentration pipeline.
+# Watson-Crick stacks: SantaLucia (1998), single internal mismatches:
+# Allawi & SantaLucia (1997-1998), Peyret et al. (1999),
+# hairpin loops: SantaLucia & Hicks (2004).
+# dH in kcal/mol, dS in cal/(K*mol), 1 M NaCl.
+
+R = 1.9872
+KELVIN = 273.15
+MAX_EXPONENT = 700.0
+
+NN_WC = {
+    'AA/TT': (-7.9, -22.2), 'AT/TA': (-7.2, -20.4),
+    'TA/AT': (-7.2, -21.3), 'CA/GT': (-8.5, -22.7),
+    'GT/CA': (-8.4, -22.4), 'CT/GA': (-7.8, -21.0),
+    'GA/CT': (-8.2, -22.2), 'CG/GC': (-10.6, -27.2),
+    'GC/CG': (-9.8, -24.4), 'GG/CC': (-8.0, -19.9),
+}
+
+NN_MISMATCH = {
+    'AG/TT': (1.0, 0.9), 'AT/TG': (-2.5, -8.3), 'CG/GT': (-4.1, -11.7),
+    'CT/GG': (-2.8, -8.0), 'GG/CT': (3.3, 10.4), 'GG/TT': (5.8, 16.3),
+    'GT/CG': (-4.4, -12.3), 'GT/TG': (4.1, 9.5), 'TG/AT': (-0.1, -1.7),
+    'TG/GT': (-1.4, -6.2), 'TT/AG': (-1.3, -5.3), 'AA/TG': (-0.6, -2.3),
+    'AG/TA': (-0.7, -2.3), 'CA/GG': (-0.7, -2.3), 'CG/GA': (-4.0, -13.2),
+    'GA/CG': (-0.6, -1.0), 'GG/CA': (0.5, 3.2), 'TA/AG': (0.7, 0.7),
+    'TG/AA': (3.0, 7.4), 'AC/TT': (0.7, 0.2), 'AT/TC': (-1.2, -6.2),
+    'CC/GT': (-0.8, -4.5), 'CT/GC': (-1.5, -6.1), 'GC/CT': (2.3, 5.4),
+    'GT/CC': (5.2, 13.5), 'TC/AT': (1.2, 0.7), 'TT/AC': (1.0, 0.7),
+    'AA/TC': (2.3, 4.6), 'AC/TA': (5.3, 14.6), 'CA/GC': (1.9, 3.7),
+    'CC/GA': (0.6, -0.6), 'GA/CC': (5.2, 14.2), 'GC/CA': (-0.7, -3.8),
+    'TA/AC': (3.4, 8.0), 'TC/AA': (7.6, 20.2), 'AA/TA': (1.2, 1.7),
+    'CA/GA': (-0.9, -4.2), 'GA/CA': (-2.9, -9.8), 'TA/AA': (4.7, 12.9),
+    'AC/TC': (0.0, -4.4), 'CC/GC': (-1.5, -7.2), 'GC/CC': (3.6, 8.9),
+    'TC/AC': (6.1, 16.4), 'AG/TG': (-3.1, -9.5), 'CG/GG': (-4.9, -15.3),
+    'GG/CG': (-6.0, -15.8), 'TG/AG': (1.6, 3.6), 'AT/TT': (-2.7, -10.8),
+    'CT/GT': (-5.0, -15.8), 'GT/CT': (-2.2, -8.4), 'TT/AT': (0.2, -1.5),
+}
+
+# Two adjacent mismatches are not covered by the tables above; they are
+# treated as a purely entropic internal loop step.
+NN_LOOP_STEP = (0.0, -3.0)
+
+INIT_TERM_GC = (0.1, -2.8)
+INIT_TERM_AT = (2.3, 4.1)
+SYMMETRY = (0.0, -1.4)
+
+HAIRPIN_LOOP_DG37 = {3: 3.5, 4: 3.5, 5: 3.3, 6: 4.0, 7: 4.2, 8: 4.3,
+                     9: 4.5, 10: 4.6}
+HAIRPIN_MIN_LOOP = 3
+HAIRPIN_MIN_STEM = 2
+
+SALT_ENTROPY_FACTOR = 0.368
+
+COMPLEMENT = {'A': 'T', 'T': 'A', 'G': 'C', 'C': 'G'}
+
+
+def is_wc(x, y):
+    return COMPLEMENT.get(x) == y
+
+
+def nn_step(x, y, x_, y_):
+    # top 5'-xy-3' paired with bottom 3'-x_y_-5'
+    key = '{}{}/{}{}'.format(x, y, x_, y_)
+    rkey = '{}{}/{}{}'.format(y_, x_, y, x)
+    for table in (NN_WC, NN_MISMATCH):
+        if key in table:
+            return table[key]
+        if rkey in table:
+            return table[rkey]
+    return NN_LOOP_STEP
+
+
+def terminal_penalty(x):
+    return INIT_TERM_AT if x in 'AT' else INIT_TERM_GC
+
+
+def dg(thermo, t):
+    dh, ds = thermo
+    return dh - (t + KELVIN) * ds / 1000.0
+
+
+def best_region(steps):
+    # contiguous run of NN steps with the lowest dG37 (Kadane)
+    best, best_sum = None, 0.0
+    start, run_sum = 0, 0.0
+    for i, step in enumerate(steps):
+        if run_sum > 0.0:
+            start, run_sum = i, 0.0
+        run_sum += dg(step, 37.0)
+        if run_sum < best_sum:
+            best, best_sum = (start, i + 1), run_sum
+    return best
+
+
+@lru_cache(maxsize=4096)
+def duplex_thermo(seq_a, seq_b):
+    a = seq_a.upper()
+    b_rev = seq_b.upper()[::-1]
+    best = None
+    for offset in range(-(len(b_rev) - 1), len(a)):
+        a_start = max(0, offset)
+        b_start = max(0, -offset)
+        length = min(len(a) - a_start, len(b_rev) - b_start)
+        if length < 2:
+            continue
+        top = a[a_start:a_start + length]
+        bottom = b_rev[b_start:b_start + length]
+        steps = [nn_step(top[i], top[i + 1], bottom[i], bottom[i + 1])
+                 for i in range(length - 1)]
+        region = best_region(steps)
+        if region is None:
+            continue
+        first, last = region
+        while first < last and not is_wc(top[first], bottom[first]):
+            first += 1
+        while last > first and not is_wc(top[last], bottom[last]):
+            last -= 1
+        if last - first < 1:
+            continue
+        dh = sum(step[0] for step in steps[first:last])
+        ds = sum(step[1] for step in steps[first:last])
+        for end in (top[first], top[last]):
+            dh += terminal_penalty(end)[0]
+            ds += terminal_penalty(end)[1]
+        if a == seq_b.upper():
+            dh += SYMMETRY[0]
+            ds += SYMMETRY[1]
+        thermo = (dh, ds, last - first)
+        if best is None or dg(thermo[:2], 37.0) < dg(best[:2], 37.0):
+            best = thermo
+    return best
+
+
+def hairpin_loop_thermo(loop_len):
+    if loop_len in HAIRPIN_LOOP_DG37:
+        dg37 = HAIRPIN_LOOP_DG37[loop_len]
+    else:
+        dg37 = HAIRPIN_LOOP_DG37[10] + \
+               2.44 * R * (37.0 + KELVIN) * math.log(loop_len / 10) / 1000.0
+    return 0.0, -dg37 * 1000.0 / (37.0 + KELVIN)
+
+
+@lru_cache(maxsize=4096)
+def hairpin_thermo(seq):
+    s = seq.upper()
+    best = None
+    for i in range(len(s)):
+        for j in range(i + HAIRPIN_MIN_LOOP + 1, len(s)):
+            if not is_wc(s[i], s[j]):
+                continue
+            dh, ds = hairpin_loop_thermo(j - i - 1)
+            stem = 1
+            while i - stem >= 0 and j + stem < len(s) and \
+                    is_wc(s[i - stem], s[j + stem]):
+                step = nn_step(s[i - stem], s[i - stem + 1],
+                               s[j + stem], s[j + stem - 1])
+                dh += step[0]
+                ds += step[1]
+                stem += 1
+            if stem < HAIRPIN_MIN_STEM:
+                continue
+            dh += terminal_penalty(s[i - stem + 1])[0]
+            ds += terminal_penalty(s[i - stem + 1])[1]
+            thermo = (dh, ds, stem - 1)
+            if best is None or dg(thermo[:2], 37.0) < dg(best[:2], 37.0):
+                best = thermo
+    return best
+
+
+def salt_corrected(thermo, na_conc, mg_conc):
+    # UNAFold DNA convention: [Na+] + 3.3 * [Mg++]^0.5
+    if thermo is None:
+        return None
+    dh, ds, steps = thermo
+    na_eq = na_conc + 3.3 * math.sqrt(mg_conc)
+    return dh, ds + SALT_ENTROPY_FACTOR * steps * math.log(na_eq)
+
+
+def equilibrium_constant(thermo, t):
+    if thermo is None:
+        return 0.0
+    exponent = -dg(thermo, t) * 1000.0 / (R * (t + KELVIN))
+    return math.exp(min(exponent, MAX_EXPONENT))
+
+
+def positive_root(quad, lin, const):
+    # root of quad*x^2 + lin*x - const = 0, stable for quad -> 0
+    return 2.0 * const / (lin + math.sqrt(lin * lin + 4.0 * quad * const))
+
+
+def solve_equilibrium(a_tot, b_tot, k_ab, k_aa, k_bb, q_a, q_b,
+                      iterations=100):
+    def free_b(a):
+        return positive_root(2.0 * k_bb, q_b + k_ab * a, b_tot)
+
+    lo, hi = 0.0, a_tot / q_a
+    for _ in range(iterations):
+        a = (lo + hi) / 2.0
+        if a * q_a + 2.0 * k_aa * a * a + k_ab * a * free_b(a) > a_tot:
+            hi = a
+        else:
+            lo = a
+        if hi - lo <= hi * 1e-12:
+            break
+    a = (lo + hi) / 2.0
+    b = free_b(a)
+    return a, b, k_aa * a * a, k_bb * b * b, k_ab * a * b
+
+
+def temperatures(t_min, t_max, t_increment):
+    # like UNAFold, stop at the last step that does not pass t_max; the
+    # epsilon keeps t_max itself when the division lands just below it
+    steps = int(math.floor((t_max - t_min) / t_increment + 1e-9))
+    return [t_min + i * t_increment for i in range(steps + 1)]
+
+
+def melt_pair(seq_a, seq_b, t_min, t_max, t_increment,
+              a_conc, na_conc, mg_conc):
+    ab = salt_corrected(duplex_thermo(seq_a, seq_b), na_conc, mg_conc)
+    aa = salt_corrected(duplex_thermo(seq_a, seq_a), na_conc, mg_conc)
+    bb = salt_corrected(duplex_thermo(seq_b, seq_b), na_conc, mg_conc)
+    hp_a = salt_corrected(hairpin_thermo(seq_a), na_conc, mg_conc)
+    hp_b = salt_corrected(hairpin_thermo(seq_b), na_conc, mg_conc)
+    ts = temperatures(t_min, t_max, t_increment)
+    concs = []
+    for t in ts:
+        ab_conc = solve_equilibrium(a_conc, a_conc,
+                                    equilibrium_constant(ab, t),
+                                    equilibrium_constant(aa, t),
+                                    equilibrium_constant(bb, t),
+                                    1.0 + equilibrium_constant(hp_a, t),
+                                    1.0 + equilibrium_constant(hp_b, t))[4]
+        concs.append(ab_conc)
+    return ts, concs
+
+
+def two_state_t(thermo, strand_conc, fraction):
+    # temperature at which `fraction` of two non self-complementary strands
+    # at equal concentration is in duplex: K = f / (c * (1 - f)^2),
+    # T = dH / (dS - R * ln(K))
+    if thermo is None:
+        return None
+    dh, ds = thermo
+    k = fraction / (strand_conc * (1.0 - fraction) ** 2)
+    denominator = ds - R * math.log(k)
+    if dh >= 0.0 or denominator >= 0.0:
+        return None
+    return dh * 1000.0 / denominator - KELVIN
+
+
+def estimate_t10_t90(seq_a, seq_b, a_conc, na_conc, mg_conc):
+    # t10/t90 follow the UNAFold convention: the duplex is at 10% / 90%
+    # of a_conc, so t10 is the higher temperature
+    thermo = salt_corrected(duplex_thermo(seq_a, seq_b), na_conc, mg_conc)
+    return (two_state_t(thermo, a_conc, 0.1),
+            two_state_t(thermo, a_conc, 0.9))
@@ -1,19 +1,29 @@
 __author__ = 'kablag'
 
 import re
+import math
+import asyncio
 from enum import Enum
-import uuid
 import os
 import time
-import shutil
 import subprocess
+import threading
+import weakref
+import itertools
+import collections
 import concurrent.futures
-import yaml
 
-from PySide import QtCore
 
-from dnatools import reverse_complement
-from dnatools import calcGC
+import numpy as np
+
+import nnmelt
+import meltcurve
+from meltcurve import MPoint
+from meltcurve import MeltCurve
+import meltcache
+import scratch
+from dnaseq import reverse_complement
+from dnaseq import calcGC
 SIMPLE_TASK_PATTERN = r'[atgc]*$'
 BEFORE_PATTERN = r'(?P<before>[atgc]*)'
 AFTER_PATTERN = r'(?P<after>[atgc]*$)'
@@ -29,22 +39,47 @@ RANGE_TASK_PATTERN = BEFORE_PATTERN + \
                      r'\[(?P<range>[atgc]*)\]' + \
                      AFTER_PATTERN
 
+EXECUTE_CHUNK_SIZE = 32
+IN_FLIGHT_PER_WORKER = 2
+UNAFOLD_THREADS = 4
+UNAFOLD_TIMEOUT = 120
+UNAFOLD_TIMINGS = 10000
+UNAFOLD_BATCHED = False
+ASYNC_CONCURRENCY = 64
+PRESCREEN_MARGIN = 5.0
+ADAPTIVE_COARSE_INCREMENT = 5.0
+ADAPTIVE_FINE_INCREMENT = 0.5
+
 class MTaskParsingError(Exception):
     pass
 
-class MeltingPot(QtCore.QObject):
+_limiters = weakref.WeakKeyDictionary()
+
+
+def default_limiter():
+    # one ASYNC_CONCURRENCY cap shared by every melt_async of a loop that
+    # is not given its own limiter
+    loop = asyncio.get_running_loop()
+    limiter = _limiters.get(loop)
+    if limiter is None:
+        limiter = _limiters[loop] = asyncio.Semaphore(ASYNC_CONCURRENCY)
+    return limiter
+
+
+class MeltingPot():
+    __slots__ = ('__name', '__a', '__b', '__length_of_a', '__gc_of_a',
+                 '__mpoints', '__conditions', '__t10', '__t90', 'on_done')
+
     def __init__(self, a, b, name=''):
-        QtCore.QObject.__init__(self)
         self.__name = name
         self.__a, self.__b, = a, b
         self.__length_of_a = len(self.__a)
         self.__gc_of_a = calcGC(self.__a)
-        self.__mpoints = []
+        self.__mpoints = MeltCurve()
         self.__conditions = None
         self.__t10 = None
         self.__t90 = None
-
-    meltDone = QtCore.Signal()
+        self.on_done = None
 
     @property
     def name(self):
@@ -86,16 +121,33 @@ class MeltingPot(QtCore.QObject):
     def mpoints_as_XY(self):
         return mpoints_to_x_y_coords(self.__mpoints)
 
+    @property
+    def pairs(self):
+        return [(self.__a, self.__b)]
+
     def melt(self, conditions):
+        self.apply_melt(conditions,
+                        [conditions.backend.melt(self.__a,
+                                                 self.__b,
+                                                 conditions)])
+
+    async def melt_async(self, conditions, limiter=None):
+        self.apply_melt(conditions,
+                        await conditions.backend.melt_many_async(
+                            self.pairs,
+                            conditions,
+                            limiter or default_limiter()))
+
+    def apply_melt(self, conditions, curves, ts=None):
         self.__conditions = conditions
-        c10 = float(self.__conditions.a_conc) * 0.1
-        c90 = float(self.__conditions.a_conc) * 0.9
-        self.__mpoints = melt(self.__a,
-                            self.__b,
-                            self.__conditions)
-        ts = calc_t_at_conc([c10, c90], self.__mpoints)
-        self.__t10 = ts[c10]
-        self.__t90 = ts[c90]
+        self.__mpoints, = curves
+        (self.__t10, self.__t90), = ts if ts else \
+            calc_t10_t90(curves, self.__conditions)
+        self.notify_done()
+
+    def notify_done(self):
+        if self.on_done is not None:
+            self.on_done(self)
 
     def __str__(self):
         return '{a}\n{b}'.format(a=self.a, b=self.b)
@@ -103,16 +155,21 @@ class MeltingPot(QtCore.QObject):
         return '{a}\n{b}'.format(a=self.a, b=self.b)
 
 class MeltingPotSNP(MeltingPot):
+    __slots__ = ('__am', '__bm', '__position', '__conditions',
+                 '__mpointsAB', '__mpointsABm', '__mpointsAmBm', '__mpointsAmB',
+                 '__t10_AB', '__t10_ABm', '__t10_AmBm', '__t10_AmB',
+                 '__t90_AB', '__t90_ABm', '__t90_AmBm', '__t90_AmB')
+
     def __init__(self, a, b, am, bm, position, mpot=None):
         # super(MeltingPotSNP, self).__init__(a, b)
         MeltingPot.__init__(self, a, b)
         self.__am = am
         self.__bm = bm
         self.__position = position
-        self.__mpointsAB = []
-        self.__mpointsABm = []
-        self.__mpointsAmBm = []
-        self.__mpointsAmB = []
+        self.__mpointsAB = MeltCurve()
+        self.__mpointsABm = MeltCurve()
+        self.__mpointsAmBm = MeltCurve()
+        self.__mpointsAmB = MeltCurve()
         self.__t10_AB = None
         self.__t10_ABm = None
         self.__t10_AmBm = None
@@ -176,57 +233,47 @@ class MeltingPotSNP(MeltingPot):
     def t90_AmB(self):
         return self.__t90_AmB
 
-    def calc_t_at_c_points(self):
-        c10 = float(self.__conditions.a_conc) * 0.1
-        c90 = float(self.__conditions.a_conc) * 0.9
-        ts_a_b = calc_t_at_conc([c10, c90], self.__mpointsAB)
-        try:
-            self.__t10_AB = round(ts_a_b[c10], 1)
-        except TypeError:
-            pass
-        try:
-            self.__t90_AB = round(ts_a_b[c90], 1)
-        except TypeError:
-            pass
-        ts_a_bm = calc_t_at_conc([c10, c90], self.__mpointsABm)
-        try:
-            self.__t10_ABm = round(ts_a_bm[c10], 1)
-        except TypeError:
-            pass
-        try:
-            self.__t90_ABm = round(ts_a_bm[c90], 1)
-        except TypeError:
-            pass
-        ts_am_bm = calc_t_at_conc([c10, c90], self.__mpointsAmBm)
-        try:
-            self.__t10_AmBm = round(ts_am_bm[c10], 1)
-        except TypeError:
-            pass
-        try:
-            self.__t90_AmBm = round(ts_am_bm[c90], 1)
-        except TypeError:
-            pass
-        ts_am_b = calc_t_at_conc([c10, c90], self.__mpointsAmB)
-        try:
-            self.__t10_AmB = round(ts_am_b[c10], 1)
-        except TypeError:
-            pass
-        try:
-            self.__t90_AmB = round(ts_am_b[c90], 1)
-        except TypeError:
-            pass
+    @property
+    def curves(self):
+        return [self.__mpointsAB,
+                self.__mpointsABm,
+                self.__mpointsAmBm,
+                self.__mpointsAmB]
+
+    def calc_t_at_c_points(self, ts=None):
+        if ts is None:
+            ts = calc_t10_t90([self.__mpointsAB,
+                               self.__mpointsABm,
+                               self.__mpointsAmBm,
+                               self.__mpointsAmB], self.__conditions)
+        (self.__t10_AB, self.__t90_AB), \
+            (self.__t10_ABm, self.__t90_ABm), \
+            (self.__t10_AmBm, self.__t90_AmBm), \
+            (self.__t10_AmB, self.__t90_AmB) = \
+            [tuple(None if t is None else round(t, 1) for t in pair_ts)
+             for pair_ts in ts]
+
+    @property
+    def pairs(self):
+        return [(self.a, self.b),
+                (self.a, self.__bm),
+                (self.__am, self.__bm),
+                (self.__am, self.b)]
 
     def melt(self, conditions):
+        self.apply_melt(conditions,
+                        conditions.backend.melt_snp(self.a,
+                                                    self.b,
+                                                    self.__am,
+                                                    self.__bm,
+                                                    conditions))
+
+    def apply_melt(self, conditions, curves, ts=None):
         self.__conditions = conditions
         self.__mpointsAB, self.__mpointsABm,\
-            self.__mpointsAmBm, self.__mpointsAmB =\
-            melt_snp(self.a,
-                            self.b,
-                            self.__am,
-                            self.__bm,
-                            self.__conditions)
-        self.calc_t_at_c_points()
-        self.meltDone.emit()
+            self.__mpointsAmBm, self.__mpointsAmB = curves
+        self.calc_t_at_c_points(ts)
+        self.notify_done()
 
 
     def __str__(self):
@@ -236,6 +283,45 @@ class MeltingPotSNP(MeltingPot):
         return 'A : {a}\nB : {b}\nAm: {am}\nBm: {bm}'.format(
             a=self.a, b=self.b,
                                  am=self.am, bm=self.bm)
+
+
+SNPCandidate = collections.namedtuple('SNPCandidate',
+                                      'length shift before after_a after_b')
+
+
+class Prescreen():
+    # Drops snp_shift candidates before melting when neither matched duplex
+    # (AB or AmBm) can land in the t10/t90 windows: both are estimated with
+    # the closed-form two-state nearest-neighbor model and given `margin`
+    # degrees of slack for its disagreement with the full melt.
+    def __init__(self, conditions, t10=(None, None), t90=(None, None),
+                 margin=PRESCREEN_MARGIN):
+        self.conditions = conditions
+        self.t10 = t10
+        self.t90 = t90
+        self.margin = margin
+
+    def estimate(self, seq_a, seq_b):
+        return nnmelt.estimate_t10_t90(seq_a, seq_b,
+                                       float(self.conditions.a_conc),
+                                       float(self.conditions.Na_conc),
+                                       float(self.conditions.Mg_conc))
+
+    def inside(self, t, window):
+        low, high = window
+        if t is None:
+            return True
+        return (low is None or t >= low - self.margin) and \
+               (high is None or t <= high + self.margin)
+
+    def accepts_pair(self, seq_a, seq_b):
+        t10, t90 = self.estimate(seq_a, seq_b)
+        return self.inside(t10, self.t10) and self.inside(t90, self.t90)
+
+    def accepts(self, mpot):
+        return self.accepts_pair(mpot.a, mpot.b) or \
+               self.accepts_pair(mpot.am, mpot.bm)
+
 class TaskType(Enum):
         simple = 0
         snp = 1
@@ -244,24 +330,31 @@ class TaskType(Enum):
         cut_range = 4
         error = 5
         
-class MTask(QtCore.QObject):
-    
-
-    meltingPotDone = QtCore.Signal(int)
+class MTask():
+    __slots__ = ('__task', '__melting_pots', '__task_type', '__snp_parts',
+                 '__lazy', '__restored', 'probeMin', 'probeMax', 'mPotsReady',
+                 'canceled', 'prescreen', 'pruned',
+                 'pot_done')
 
     def __init__(self, mtask, mtaskYAML=None):
-        QtCore.QObject.__init__(self)
         self.__task = None
         self.__melting_pots = []
         self.__task_type = TaskType.error
-        self.task = mtask
+        self.__snp_parts = None
+        self.__lazy = False
+        self.__restored = {}
         self.probeMin = None
         self.probeMax = None
+        self.task = mtask
         self.mPotsReady = 0
         self.canceled = False
+        self.pot_done = None
+        self.prescreen = None
+        self.pruned = 0
         if mtaskYAML:
             self.probeMin = mtaskYAML['probeMin']
             self.probeMax = mtaskYAML['probeMax']
+            self.__lazy = False
             self.__melting_pots = \
                 [MeltingPotSNP(mpot['A'],
                                mpot['B'],
@@ -274,6 +367,12 @@ class MTask(QtCore.QObject):
     def melting_pots(self):
         return self.__melting_pots
 
+    @property
+    def pot_count(self):
+        if self.__lazy:
+            return sum(range(self.probeMin, self.probeMax + 1))
+        return len(self.__melting_pots)
+
     @property
     def task_type(self):
         return self.__task_type
@@ -287,6 +386,7 @@ class MTask(QtCore.QObject):
         self.__task = task.replace(" ", "")
         self.__task = task.replace("\n", "")
         self.__melting_pots = []
+        self.__lazy = False
         patterns = {re.compile(SIMPLE_TASK_PATTERN, re.IGNORECASE):
                         TaskType.simple,
                     re.compile(SNP_TASK_PATTERN, re.IGNORECASE):
@@ -355,11 +455,8 @@ class MTask(QtCore.QObject):
             ]
         elif self.__task_type is TaskType.snp_shift:
             before = match_result.group('before').lower()
-            before_len = len(before)
             wt = match_result.group('wt').upper()
-            wt_len = len(wt)
             mut = match_result.group('mut').upper()
-            mut_len = len(mut)
             after = match_result.group('after').lower()
             self.probeMin = int(match_result.group('min'))
             self.probeMax = int(match_result.group('max'))
@@ -367,65 +464,158 @@ class MTask(QtCore.QObject):
                                                                         wt=wt,
                                                                         mut=mut,
                                                                         aft=after,)
-            self.__melting_pots = []
-
-            for pr_len in range(self.probeMin, self.probeMax + 1):
-                for shift in range(0, pr_len):
-                    def new_pot(x, x_len, y, y_len):
-                        mpotsnp = MeltingPotSNP(
-                        a=''.join([before[before_len - shift:],
-                                x,
-                                after[:pr_len - shift - x_len]]),
-                        am=''.join([before[before_len - shift:],
-                                y,
-                                after[:pr_len - shift - x_len]]),
-                        b=reverse_complement(''.join(
-                                [before[before_len - shift:],
-                                x,
-                                after[:pr_len - shift - y_len]])),
-                        bm=reverse_complement(''.join(
-                                [before[before_len - shift:],
-                                y,
-                                after[:pr_len - shift - y_len]])),
-                        position=str(shift))
-                        mpotsnp.meltDone.connect(self.on_melt_ready)
-                        return mpotsnp
-                    self.melting_pots.append(
-                        new_pot(wt, wt_len, mut, mut_len)
-                    )
+            self.__snp_parts = (before, wt, mut, after)
+            self.__lazy = True
         elif self.__task_type is TaskType.error:
             raise MTaskParsingError
         else:
             raise MTaskParsingError
 
-    def execute(self, conditions):
+    def candidates(self):
+        if self.__task_type is not TaskType.snp_shift:
+            return
+        before, wt, mut, after = self.__snp_parts
+        for pr_len in range(self.probeMin, self.probeMax + 1):
+            for shift in range(0, pr_len):
+                yield SNPCandidate(length=pr_len,
+                                   shift=shift,
+                                   before=len(before) - shift,
+                                   after_a=pr_len - shift - len(wt),
+                                   after_b=pr_len - shift - len(mut))
+
+    def materialize(self, candidate):
+        before, wt, mut, after = self.__snp_parts
+        flank = before[candidate.before:]
+        a = ''.join([flank, wt, after[:candidate.after_a]])
+        am = ''.join([flank, mut, after[:candidate.after_a]])
+        b = reverse_complement(''.join([flank, wt, after[:candidate.after_b]]))
+        bm = reverse_complement(''.join([flank, mut,
+                                         after[:candidate.after_b]]))
+        mpotsnp = MeltingPotSNP(a, b, am, bm,
+                                position=str(candidate.shift),
+                                mpot=self.__restored.get((a, b, am, bm)))
+        mpotsnp.on_done = self.on_melt_ready
+        return mpotsnp
+
+    def restore(self, mpots):
+        # mpots: project style dicts of already melted pots, they are
+        # rebuilt from their t values instead of being melted again
+        self.__restored = {(mpot['A'], mpot['B'], mpot['Am'], mpot['Bm']):
+                               mpot for mpot in mpots}
+
+    def __scheduled_pots(self):
+        if not self.__lazy:
+            for mpot in self.__melting_pots:
+                yield mpot
+            return
+        self.__melting_pots = []
+        self.pruned = 0
+        for candidate in self.candidates():
+            mpot = self.materialize(candidate)
+            if (mpot.a, mpot.b, mpot.am, mpot.bm) in self.__restored:
+                self.__melting_pots.append(mpot)
+                self.mPotsReady += 1
+            elif self.prescreen is not None and \
+                    not self.prescreen.accepts(mpot):
+                self.pruned += 1
+            else:
+                self.__melting_pots.append(mpot)
+                yield mpot
+
+    def __chunks(self, workers, chunk_size):
+        if not chunk_size:
+            # only lazily enumerated candidates are spread over the
+            # workers; the pots of other tasks share strands and stay in
+            # one plan
+            chunk_size = EXECUTE_CHUNK_SIZE
+            if self.__lazy:
+                chunk_size = max(1, min(chunk_size,
+                                        -(-self.pot_count // workers)))
+        pots = self.__scheduled_pots()
+        return iter(lambda: list(itertools.islice(pots, chunk_size)), [])
+
+    def execute(self, conditions, workers=None, chunk_size=None,
+                executor=None):
+        self.mPotsReady = 0
+        self.canceled = False
+        workers = workers if workers else os.cpu_count() or 1
+        chunks = self.__chunks(workers, chunk_size)
+        if executor is None:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=workers) as executor:
+                self.__execute_chunks(chunks, conditions, executor,
+                                      workers * IN_FLIGHT_PER_WORKER)
+        else:
+            self.__execute_chunks(chunks, conditions, executor,
+                                  workers * IN_FLIGHT_PER_WORKER)
+
+    def __execute_chunks(self, chunks, conditions, executor, max_in_flight):
+        pending = {}
+        while True:
+            while not self.canceled and len(pending) < max_in_flight:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pairs = [pair for mpot in chunk for pair in mpot.pairs]
+                pending[executor.submit(melt_pairs,
+                                        pairs,
+                                        conditions)] = chunk
+            if not pending:
+                break
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                apply_curves(pending.pop(future), conditions, future.result())
+
+    async def execute_async(self, conditions,
+                            concurrency=ASYNC_CONCURRENCY, chunk_size=None):
         self.mPotsReady = 0
         self.canceled = False
-        for mpot in self.__melting_pots:
-            if self.canceled:
+        limiter = asyncio.Semaphore(concurrency)
+        chunks = self.__chunks(concurrency, chunk_size)
+        pending = {}
+        while True:
+            while not self.canceled and len(pending) < concurrency:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pairs = [pair for mpot in chunk for pair in mpot.pairs]
+                pending[asyncio.ensure_future(
+                    conditions.backend.melt_many_async(pairs,
+                                                       conditions,
+                                                       limiter))] = chunk
+            if not pending:
                 break
-            mpot.melt(conditions)
+            done, _ = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                chunk = pending.pop(future)
+                apply_curves(chunk, conditions, future.result())
+                for mpot in chunk:
+                    yield mpot
 
     def cancel(self):
         self.canceled = True
 
-    @QtCore.Slot()
-    def on_melt_ready(self):
+    def on_melt_ready(self, mpot):
         self.mPotsReady += 1
-        # time.sleep(0.2)
-        QtCore.QCoreApplication.processEvents()
-        self.meltingPotDone.emit(self.mPotsReady)
-
-class MPoint():
-    def __init__(self, t, conc):
-        self.t = t
-        self.conc = conc
+        if self.pot_done is not None:
+            self.pot_done(mpot, self.mPotsReady)
 
-    def __repr__(self):
-        return 't = {t}\tC = {c}'.format(t=self.t, c=self.conc)
+def melt_pairs(pairs, conditions):
+    return conditions.backend.melt_many(pairs, conditions)
 
+def apply_curves(mpots, conditions, curves):
+    ts = calc_t10_t90(curves, conditions)
+    start = 0
+    for mpot in mpots:
+        end = start + len(mpot.pairs)
+        mpot.apply_melt(conditions, curves[start:end], ts[start:end])
+        start = end
 
 def mpoints_to_x_y_coords(mpoints):
+    if isinstance(mpoints, MeltCurve):
+        return mpoints.as_XY
     x = []
     y = []
     for mpoint in mpoints:
@@ -434,122 +624,745 @@ def mpoints_to_x_y_coords(mpoints):
     return (x, y)
 
 
-def exec_unafold_commands(commands, working_dir):
-    # startupinfo = subprocess.STARTUPINFO()
-    # startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-    # startupinfo.wShowWindow = subprocess.SW_HIDE
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-        executor.map(lambda command:
-                     subprocess.call(command,
-                                     cwd=working_dir,
-                                     stdout=open(os.devnull, "w"),
-                                     stderr=subprocess.STDOUT,
-                     ),
-                     commands)
-
-
-def melt(seq_a, seq_b, conditions):
-    id = uuid.uuid1().hex
-    path = conditions.ram_disk + id + '/'
-    os.mkdir(path)
-    with open('{path}a'.format(path=path), 'w') as f:
-        print(seq_a, file=f)
-    with open('{path}b'.format(path=path), 'w') as f:
-        print(seq_b, file=f)
-
-    commands = [conditions.hybrid_ss_a,
-                conditions.hybrid_ss_b,
-                conditions.hybrid_a_b,
-                conditions.hybrid_a_a,
-                conditions.hybrid_b_b,
-    ]
-    exec_unafold_commands(commands, path)
-
-    commands = [conditions.sbs,
-                conditions.concentration_same,
-                conditions.concentration]
-    exec_unafold_commands(commands, path)
-
-    with open('{path}a-b.conc'.format(path=path), 'r') as f:
-        rows = f.readlines()
-
-    def melt_point_from_row(row):
-        values = row.split('\t')
-        return MPoint(float(values[0]), float(values[len(values) - 1]))
-
-    mpoints = map(melt_point_from_row, rows[1:])
-    shutil.rmtree(path)
-    return list(mpoints)
-
-def melt_snp(seq_a, seq_b, seq_am, seq_bm, conditions):
-    id = uuid.uuid1().hex
-    path = conditions.ram_disk + id + '/'
-    os.mkdir(path)
-    with open('{path}a'.format(path=path), 'w') as f:
-        print(seq_a, file=f)
-    with open('{path}b'.format(path=path), 'w') as f:
-        print(seq_b, file=f)
-    with open('{path}am'.format(path=path), 'w') as f:
-        print(seq_am, file=f)
-    with open('{path}bm'.format(path=path), 'w') as f:
-        print(seq_bm, file=f)
-
-    commands = [conditions.hybrid_ss_a,
-                conditions.hybrid_ss_b,
-                conditions.hybrid_ss_am,
-                conditions.hybrid_ss_bm,
-                conditions.hybrid_a_b,
-                conditions.hybrid_a_a,
-                conditions.hybrid_b_b,
-                conditions.hybrid_am_am,
-                conditions.hybrid_bm_bm,
-                conditions.hybrid_am_bm,
-                conditions.hybrid_am_b,
-                conditions.hybrid_a_bm,
-    ]
-    exec_unafold_commands(commands, path)
-
-    commands = [conditions.sbs_a,
-                conditions.concentration_a_b,
-                conditions.concentration_a_bm,
-                ]
-    exec_unafold_commands(commands, path)
-    commands = [conditions.sbs_am,
-                conditions.concentration_am_bm,
-                conditions.concentration_am_b,
-                ]
-    exec_unafold_commands(commands, path)
-
-
-    with open('{path}a-b.conc'.format(path=path), 'r') as f:
-        rows_a_b = f.readlines()
-    with open('{path}a-bm.conc'.format(path=path), 'r') as f:
-        rows_a_bm = f.readlines()
-    with open('{path}am-bm.conc'.format(path=path), 'r') as f:
-        rows_am_bm = f.readlines()
-    with open('{path}am-b.conc'.format(path=path), 'r') as f:
-        rows_am_b = f.readlines()
-
-    def melt_point_from_row(row):
-        values = row.split('\t')
-        return MPoint(float(values[0]), float(values[len(values) - 1]))
-
-    mpoints_a_b = map(melt_point_from_row, rows_a_b[1:])
-    mpoints_a_bm = map(melt_point_from_row, rows_a_bm[1:])
-    mpoints_am_bm = map(melt_point_from_row, rows_am_bm[1:])
-    mpoints_am_b = map(melt_point_from_row, rows_am_b[1:])
-    shutil.rmtree(path)
-    return (list(mpoints_a_b),
-            list(mpoints_a_bm),
-            list(mpoints_am_bm),
-            list(mpoints_am_b),)
+class UnafoldCommandError(Exception):
+    def __init__(self, command, returncode, output=''):
+        self.command = command
+        self.returncode = returncode
+        self.output = output
+        if returncode is None:
+            message = '{command} failed'.format(command=' '.join(command))
+        else:
+            message = '{command} exited with {code}'.format(
+                command=' '.join(command), code=returncode)
+        if output:
+            message += ': ' + output
+        super(UnafoldCommandError, self).__init__(message)
+
 
+class UnafoldTimeoutError(UnafoldCommandError):
+    def __init__(self, command, timeout):
+        UnafoldCommandError.__init__(
+            self, command, None,
+            'timed out after {timeout} s'.format(timeout=timeout))
+        self.timeout = timeout
+
+
+class UnafoldOutputError(Exception):
+    pass
+
+
+class UnafoldRunner():
+    def __init__(self, max_workers=UNAFOLD_THREADS, timeout=UNAFOLD_TIMEOUT,
+                 keep_timings=UNAFOLD_TIMINGS):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.timings = collections.deque(maxlen=keep_timings)
+        self.totals = {}
+        self.__lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_UnafoldRunner__lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    def __record(self, command, seconds):
+        tool = os.path.basename(command[0])
+        with self.__lock:
+            self.timings.append((command, seconds))
+            count, total = self.totals.get(tool, (0, 0.0))
+            self.totals[tool] = (count + 1, total + seconds)
+
+    def run(self, command, working_dir):
+        start = time.perf_counter()
+        try:
+            result = subprocess.run(command,
+                                    cwd=working_dir,
+                                    stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE,
+                                    timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            raise UnafoldTimeoutError(command, self.timeout)
+        except OSError as error:
+            raise UnafoldCommandError(command, None, str(error))
+        self.__record(command, time.perf_counter() - start)
+        if result.returncode != 0:
+            raise UnafoldCommandError(
+                command, result.returncode,
+                result.stderr.decode(errors='replace').strip())
+
+    def run_all(self, commands, working_dir):
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.run, command, working_dir)
+                       for command in commands]
+            for future in concurrent.futures.as_completed(futures):
+                if future.exception() is not None:
+                    for other in futures:
+                        other.cancel()
+                    raise future.exception()
+
+    async def run_async(self, command, working_dir, limiter):
+        async with limiter:
+            start = time.perf_counter()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *command,
+                    cwd=working_dir,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE)
+            except OSError as error:
+                raise UnafoldCommandError(command, None, str(error))
+            try:
+                _, stderr = await asyncio.wait_for(process.communicate(),
+                                                   self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise UnafoldTimeoutError(command, self.timeout)
+            except BaseException:
+                # canceled because a sibling failed: the child must not
+                # outlive the workspace it writes into
+                if process.returncode is None:
+                    try:
+                        process.kill()
+                    except ProcessLookupError:
+                        pass
+                    await process.wait()
+                raise
+            self.__record(command, time.perf_counter() - start)
+            if process.returncode != 0:
+                raise UnafoldCommandError(
+                    command, process.returncode,
+                    stderr.decode(errors='replace').strip())
+
+    async def run_all_async(self, commands, working_dir, limiter):
+        tasks = [asyncio.ensure_future(self.run_async(command,
+                                                      working_dir,
+                                                      limiter))
+                 for command in commands]
+        try:
+            await asyncio.gather(*tasks)
+        except Exception:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+
+DEFAULT_RUNNER = UnafoldRunner()
+
+
+def exec_unafold_commands(commands, working_dir, runner=None):
+    (runner if runner else DEFAULT_RUNNER).run_all(commands, working_dir)
+
+
+async def exec_unafold_commands_async(commands, working_dir, limiter,
+                                      runner=None):
+    await (runner if runner else DEFAULT_RUNNER).run_all_async(commands,
+                                                               working_dir,
+                                                               limiter)
+
+
+def write_strands(path, strands):
+    for name, seq in strands:
+        with open(os.path.join(path, name), 'w') as f:
+            print(seq, file=f)
+
+
+def read_conc(path, conditions=None):
+    return meltcurve.read_conc(path,
+                               len(conditions.temperatures)
+                               if conditions else None)
+
+
+def melt(seq_a, seq_b, conditions, runner=None):
+    with conditions.workspace() as path:
+        write_strands(path, [('a', seq_a), ('b', seq_b)])
+
+        commands = [conditions.hybrid_ss_a,
+                    conditions.hybrid_ss_b,
+                    conditions.hybrid_a_b,
+                    conditions.hybrid_a_a,
+                    conditions.hybrid_b_b,
+        ]
+        exec_unafold_commands(commands, path, runner)
+
+        commands = [conditions.sbs,
+                    conditions.concentration_same,
+                    conditions.concentration]
+        exec_unafold_commands(commands, path, runner)
+
+        return read_conc(os.path.join(path, 'a-b.conc'), conditions)
+
+def melt_snp(seq_a, seq_b, seq_am, seq_bm, conditions, runner=None):
+    with conditions.workspace() as path:
+        write_strands(path, [('a', seq_a), ('b', seq_b),
+                             ('am', seq_am), ('bm', seq_bm)])
+
+        commands = [conditions.hybrid_ss_a,
+                    conditions.hybrid_ss_b,
+                    conditions.hybrid_ss_am,
+                    conditions.hybrid_ss_bm,
+                    conditions.hybrid_a_b,
+                    conditions.hybrid_a_a,
+                    conditions.hybrid_b_b,
+                    conditions.hybrid_am_am,
+                    conditions.hybrid_bm_bm,
+                    conditions.hybrid_am_bm,
+                    conditions.hybrid_am_b,
+                    conditions.hybrid_a_bm,
+        ]
+        exec_unafold_commands(commands, path, runner)
+
+        commands = [conditions.sbs_a,
+                    conditions.concentration_a_b,
+                    conditions.concentration_a_bm,
+                    ]
+        exec_unafold_commands(commands, path, runner)
+        commands = [conditions.sbs_am,
+                    conditions.concentration_am_bm,
+                    conditions.concentration_am_b,
+                    ]
+        exec_unafold_commands(commands, path, runner)
+
+        return (read_conc(os.path.join(path, 'a-b.conc'), conditions),
+                read_conc(os.path.join(path, 'a-bm.conc'), conditions),
+                read_conc(os.path.join(path, 'am-bm.conc'), conditions),
+                read_conc(os.path.join(path, 'am-b.conc'), conditions),)
+
+
+class MeltPlan():
+    def __init__(self, pairs):
+        self.__strands = {}
+        self.__pairs = [(self.__strand_name(a), self.__strand_name(b))
+                        for a, b in pairs]
+
+    def __strand_name(self, seq):
+        if seq not in self.__strands:
+            self.__strands[seq] = 's{}'.format(len(self.__strands))
+        return self.__strands[seq]
+
+    @property
+    def strands(self):
+        return self.__strands
+
+    @property
+    def sequences(self):
+        return {name: seq for seq, name in self.__strands.items()}
+
+    @property
+    def pairs(self):
+        return self.__pairs
+
+    @property
+    def unique_pairs(self):
+        return list(dict.fromkeys(self.__pairs))
+
+    @property
+    def hybrid_pairs(self):
+        hybrids = []
+        for a, b in self.unique_pairs:
+            hybrids += [(a, b), (a, a), (b, b)]
+        return list(dict.fromkeys(hybrids))
+
+    def hybrid_commands(self, conditions):
+        return [conditions.hybrid_ss_command(name)
+                for name in self.strands.values()] + \
+               [conditions.hybrid_command(a, b)
+                for a, b in self.hybrid_pairs]
+
+    def concentration_commands(self, conditions):
+        firsts = dict.fromkeys(a for a, b in self.unique_pairs)
+        return [conditions.sbs_command(name) for name in firsts] + \
+               [conditions.concentration_command(a, b)
+                for a, b in self.unique_pairs]
+
+
+# Batched mode feeds every strand of a plan to one hybrid-ss run and every
+# hybrid pair to one hybrid run as multi-record FASTA files. It assumes
+# UNAFold names the output after the input prefix (ss.seq -> ss.dG,
+# ha.seq + hb.seq -> ha-hb.dG) and writes one '#T'-headed .dG block per
+# record (pair) in input order; the blocks are split back into the per
+# strand/pair .dG files that sbs and concentration read.
+BATCHED_SS = 'ss'
+BATCHED_HYBRID = ('ha', 'hb')
+
+
+def batched_hybrid_commands(plan, conditions):
+    commands = []
+    if plan.strands:
+        commands.append(conditions.hybrid_ss_command(BATCHED_SS + '.seq'))
+    if plan.hybrid_pairs:
+        commands.append(conditions.hybrid_command(BATCHED_HYBRID[0] + '.seq',
+                                                  BATCHED_HYBRID[1] + '.seq'))
+    return commands
+
+
+def write_records(path, prefix, records):
+    with open(os.path.join(path, prefix + '.seq'), 'w') as f:
+        for name, seq in records:
+            print('>{name}\n{seq}'.format(name=name, seq=seq), file=f)
+
+
+def write_batched_inputs(plan, path):
+    sequences = plan.sequences
+    write_records(path, BATCHED_SS,
+                  [(name, seq) for seq, name in plan.strands.items()])
+    for prefix, side in zip(BATCHED_HYBRID, (0, 1)):
+        write_records(path, prefix,
+                      [(pair[side], sequences[pair[side]])
+                       for pair in plan.hybrid_pairs])
+
+
+def split_dg(path, filename, names):
+    if not names:
+        return
+    blocks = []
+    with open(os.path.join(path, filename), 'r') as f:
+        for line in f:
+            if line.startswith('#'):
+                blocks.append([])
+            elif not blocks:
+                raise UnafoldOutputError(
+                    '{filename}: data before the first header'.format(
+                        filename=filename))
+            blocks[-1].append(line)
+    if len(blocks) != len(names):
+        raise UnafoldOutputError(
+            '{filename}: {n} blocks for {records} records'.format(
+                filename=filename, n=len(blocks), records=len(names)))
+    for name, block in zip(names, blocks):
+        with open(os.path.join(path, name + '.dG'), 'w') as f:
+            f.writelines(block)
+
+
+def split_batched_outputs(plan, path):
+    split_dg(path, BATCHED_SS + '.dG', list(plan.strands.values()))
+    split_dg(path, '-'.join(BATCHED_HYBRID) + '.dG',
+             ['{a}-{b}'.format(a=a, b=b) for a, b in plan.hybrid_pairs])
+
+
+class StagedPlan(MeltPlan):
+    # The part of a MeltPlan whose UNAFold stage outputs are not cached yet.
+    # Cached .dG (hybrid-ss, hybrid) and .conc (sbs + concentration) files
+    # are written into the workspace; each stage is keyed only by the
+    # conditions it reads, so a new a_conc reruns concentration alone.
+    def __init__(self, plan, conditions, cache, path):
+        self.__plan = plan
+        self.__conditions = conditions
+        self.__cache = cache
+        self.__path = path
+        self.__missing = []
+        sequences = plan.sequences
+        self.__unique_pairs = [
+            (a, b) for a, b in plan.unique_pairs
+            if not self.__restore('concentration',
+                                  '{a}-{b}.conc'.format(a=a, b=b),
+                                  sequences[a], sequences[b])]
+        hybrids = []
+        for a, b in self.__unique_pairs:
+            hybrids += [(a, b), (a, a), (b, b)]
+        self.__hybrid_pairs = [
+            (a, b) for a, b in dict.fromkeys(hybrids)
+            if not self.__restore('hybrid', '{a}-{b}.dG'.format(a=a, b=b),
+                                  sequences[a], sequences[b])]
+        names = dict.fromkeys(name for pair in self.__unique_pairs
+                              for name in pair)
+        self.__strands = {sequences[name]: name for name in names
+                          if not self.__restore('hybrid-ss',
+                                                name + '.dG',
+                                                sequences[name])}
+
+    def __restore(self, stage, filename, *seqs):
+        key = meltcache.stage_key(stage, self.__conditions, *seqs)
+        data = self.__cache.get_artifact(key)
+        if data is None:
+            self.__missing.append((key, filename))
+            return False
+        with open(os.path.join(self.__path, filename), 'wb') as f:
+            f.write(data)
+        return True
+
+    def store(self):
+        for key, filename in self.__missing:
+            with open(os.path.join(self.__path, filename), 'rb') as f:
+                self.__cache.put_artifact(key, f.read())
+        self.__missing = []
+
+    @property
+    def strands(self):
+        return self.__strands
+
+    @property
+    def sequences(self):
+        return self.__plan.sequences
+
+    @property
+    def pairs(self):
+        return self.__plan.pairs
+
+    @property
+    def unique_pairs(self):
+        return self.__unique_pairs
+
+    @property
+    def hybrid_pairs(self):
+        return self.__hybrid_pairs
+
+
+def read_plan_curves(plan, path, conditions):
+    curves = {(a, b): read_conc(os.path.join(path, '{a}-{b}.conc'.format(
+                  a=a, b=b)), conditions)
+              for a, b in plan.unique_pairs}
+    return [curves[pair] for pair in plan.pairs]
+
+
+def melt_plan(plan, conditions, runner=None, batched=False, stages=None):
+    with conditions.workspace() as path:
+        write_strands(path, [(name, seq)
+                             for seq, name in plan.strands.items()])
+        todo = StagedPlan(plan, conditions, stages, path) if stages else plan
+        if batched:
+            write_batched_inputs(todo, path)
+            exec_unafold_commands(batched_hybrid_commands(todo, conditions),
+                                  path, runner)
+            split_batched_outputs(todo, path)
+        else:
+            exec_unafold_commands(todo.hybrid_commands(conditions), path,
+                                  runner)
+        exec_unafold_commands(todo.concentration_commands(conditions), path,
+                              runner)
+        if stages:
+            todo.store()
+        return read_plan_curves(plan, path, conditions)
+
+
+async def melt_plan_async(plan, conditions, limiter, runner=None,
+                          batched=False, stages=None):
+    with conditions.workspace() as path:
+        write_strands(path, [(name, seq)
+                             for seq, name in plan.strands.items()])
+        todo = StagedPlan(plan, conditions, stages, path) if stages else plan
+        if batched:
+            write_batched_inputs(todo, path)
+            await exec_unafold_commands_async(
+                batched_hybrid_commands(todo, conditions), path, limiter,
+                runner)
+            split_batched_outputs(todo, path)
+        else:
+            await exec_unafold_commands_async(
+                todo.hybrid_commands(conditions), path, limiter, runner)
+        await exec_unafold_commands_async(
+            todo.concentration_commands(conditions), path, limiter, runner)
+        if stages:
+            todo.store()
+        return read_plan_curves(plan, path, conditions)
+
+
+def melt_nn(seq_a, seq_b, conditions):
+    ts, concs = nnmelt.melt_pair(seq_a, seq_b,
+                                 float(conditions.t_min),
+                                 float(conditions.t_max),
+                                 float(conditions.t_increment),
+                                 float(conditions.a_conc),
+                                 float(conditions.Na_conc),
+                                 float(conditions.Mg_conc))
+    return MeltCurve(ts, concs)
+
+def melt_snp_nn(seq_a, seq_b, seq_am, seq_bm, conditions):
+    return (melt_nn(seq_a, seq_b, conditions),
+            melt_nn(seq_a, seq_bm, conditions),
+            melt_nn(seq_am, seq_bm, conditions),
+            melt_nn(seq_am, seq_b, conditions),)
+
+
+class MeltBackend():
+    name = None
+    version = None
+
+    def melt(self, seq_a, seq_b, conditions):
+        raise NotImplementedError
+
+    def melt_snp(self, seq_a, seq_b, seq_am, seq_bm, conditions):
+        return (self.melt(seq_a, seq_b, conditions),
+                self.melt(seq_a, seq_bm, conditions),
+                self.melt(seq_am, seq_bm, conditions),
+                self.melt(seq_am, seq_b, conditions),)
+
+    def melt_many(self, pairs, conditions):
+        curves = {}
+        for pair in pairs:
+            if pair not in curves:
+                curves[pair] = self.melt(pair[0], pair[1], conditions)
+        return [curves[pair] for pair in pairs]
+
+    async def melt_many_async(self, pairs, conditions, limiter):
+        async with limiter:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.melt_many, pairs, conditions)
+
+
+class UnafoldBackend(MeltBackend):
+    name = 'unafold'
+    version = '1'
+
+    def __init__(self, runner=None, batched=UNAFOLD_BATCHED, stages=None):
+        # stages: a meltcache.MeltCache for per stage UNAFold artifacts
+        self.runner = runner if runner else DEFAULT_RUNNER
+        self.batched = batched
+        self.stages = stages
+
+    @property
+    def planned(self):
+        return self.batched or self.stages is not None
+
+    def melt(self, seq_a, seq_b, conditions):
+        if self.planned:
+            return self.melt_many([(seq_a, seq_b)], conditions)[0]
+        return melt(seq_a, seq_b, conditions, self.runner)
+
+    def melt_snp(self, seq_a, seq_b, seq_am, seq_bm, conditions):
+        if self.planned:
+            return tuple(self.melt_many([(seq_a, seq_b),
+                                         (seq_a, seq_bm),
+                                         (seq_am, seq_bm),
+                                         (seq_am, seq_b)], conditions))
+        return melt_snp(seq_a, seq_b, seq_am, seq_bm, conditions,
+                        self.runner)
+
+    def melt_many(self, pairs, conditions):
+        return melt_plan(MeltPlan(pairs), conditions, self.runner,
+                         self.batched, self.stages)
+
+    async def melt_many_async(self, pairs, conditions, limiter):
+        return await melt_plan_async(MeltPlan(pairs), conditions, limiter,
+                                     self.runner, self.batched, self.stages)
+
+
+class NNBackend(MeltBackend):
+    name = 'nn'
+    version = '1'
+
+    def melt(self, seq_a, seq_b, conditions):
+        return melt_nn(seq_a, seq_b, conditions)
+
+
+class StandInBackend(MeltBackend):
+    # Deterministic sigmoid curves for exercising the orchestration on
+    # machines without UNAFold; delay emulates the per-pair melting cost.
+    name = 'stand-in'
+    version = '1'
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def melt(self, seq_a, seq_b, conditions):
+        if self.delay:
+            time.sleep(self.delay)
+        target = reverse_complement(seq_b).lower()
+        seq_a = seq_a.lower()
+        mismatches = sum(1 for x, y in zip(seq_a, target) if x != y) + \
+            abs(len(seq_a) - len(target))
+        tm = 64.9 + 41 * (calcGC(seq_a) * len(seq_a) / 100 - 16.4) / \
+            len(seq_a) - 5 * mismatches
+        ts = np.array(conditions.temperatures)
+        return MeltCurve(ts, float(conditions.a_conc) /
+                         (1 + np.exp(np.minimum((ts - tm) / 1.5, 700))))
+
+
+class CachedBackend(MeltBackend):
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+        self.name = backend.name
+        self.version = backend.version
+
+    def __lookup(self, pairs, conditions):
+        keys = [meltcache.melt_key(self.backend, conditions, a, b)
+                for a, b in pairs]
+        curves = []
+        for key in keys:
+            hit = self.cache.get(key)
+            if hit is None:
+                return keys, None
+            curves.append(MeltCurve(hit[0], hit[1]))
+        return keys, curves
+
+    def __store(self, keys, curves, conditions):
+        c10 = float(conditions.a_conc) * 0.1
+        c90 = float(conditions.a_conc) * 0.9
+        for key, mpoints in zip(keys, curves):
+            ts = calc_t_at_conc([c10, c90], mpoints)
+            x, y = mpoints_to_x_y_coords(mpoints)
+            self.cache.put(key, x, y, ts[c10], ts[c90])
+
+    def melt(self, seq_a, seq_b, conditions):
+        keys, curves = self.__lookup([(seq_a, seq_b)], conditions)
+        if curves is None:
+            curves = [self.backend.melt(seq_a, seq_b, conditions)]
+            self.__store(keys, curves, conditions)
+        return curves[0]
+
+    def melt_snp(self, seq_a, seq_b, seq_am, seq_bm, conditions):
+        keys, curves = self.__lookup([(seq_a, seq_b),
+                                      (seq_a, seq_bm),
+                                      (seq_am, seq_bm),
+                                      (seq_am, seq_b)], conditions)
+        if curves is None:
+            curves = self.backend.melt_snp(seq_a, seq_b, seq_am, seq_bm,
+                                           conditions)
+            self.__store(keys, curves, conditions)
+        return tuple(curves)
+
+    def __lookup_many(self, pairs, conditions):
+        curves = {}
+        for pair in pairs:
+            if pair not in curves:
+                curves[pair] = self.__lookup([pair], conditions)
+        return curves, [pair for pair in curves if curves[pair][1] is None]
+
+    def __fill(self, curves, missing, melted, conditions):
+        for pair, mpoints in zip(missing, melted):
+            keys = curves[pair][0]
+            self.__store(keys, [mpoints], conditions)
+            curves[pair] = keys, [mpoints]
+
+    def melt_many(self, pairs, conditions):
+        curves, missing = self.__lookup_many(pairs, conditions)
+        if missing:
+            self.__fill(curves, missing,
+                        self.backend.melt_many(missing, conditions),
+                        conditions)
+        return [curves[pair][1][0] for pair in pairs]
+
+    async def melt_many_async(self, pairs, conditions, limiter):
+        curves, missing = self.__lookup_many(pairs, conditions)
+        if missing:
+            self.__fill(curves, missing,
+                        await self.backend.melt_many_async(missing,
+                                                           conditions,
+                                                           limiter),
+                        conditions)
+        return [curves[pair][1][0] for pair in pairs]
+
+
+class AdaptiveBackend(MeltBackend):
+    # Coarse sweep over the whole range, then a fine sweep only over the
+    # coarse grid cells that bracket t90..t10; the fine points replace the
+    # coarse ones there. The fine sweep is one melt_many over the union of
+    # all windows, so a chunk stays one plan. It pays off where cost grows
+    # with the number of points (nn, standin), not for UNAFold, which is
+    # dominated by process launches.
+    def __init__(self, backend,
+                 coarse_increment=ADAPTIVE_COARSE_INCREMENT,
+                 fine_increment=ADAPTIVE_FINE_INCREMENT):
+        self.backend = backend
+        self.coarse_increment = coarse_increment
+        self.fine_increment = fine_increment
+        self.name = 'adaptive-' + backend.name
+        self.version = '{version}/{coarse}/{fine}'.format(
+            version=backend.version, coarse=coarse_increment,
+            fine=fine_increment)
+
+    def coarse_conditions(self, conditions):
+        return conditions.replace(t_increment=self.coarse_increment,
+                                  backend=self.backend)
+
+    def fine_conditions(self, conditions, window):
+        return conditions.replace(t_min=window[0],
+                                  t_max=window[1],
+                                  t_increment=self.fine_increment,
+                                  backend=self.backend)
+
+    def windows(self, curves, conditions):
+        if not curves:
+            return []
+        t_min = float(conditions.t_min)
+        t_max = float(conditions.t_max)
+        step = self.coarse_increment
+        ts = meltcurve.calc_t_at_fractions(
+            curves[0].t, np.vstack([curve.conc for curve in curves]),
+            [0.1, 0.9], float(conditions.a_conc))
+        windows = []
+        for crossings in ts:
+            crossings = crossings[~np.isnan(crossings)]
+            if not crossings.size:
+                windows.append(None)
+                continue
+            low = t_min + math.floor(
+                round((crossings.min() - t_min) / step, 6)) * step
+            high = t_min + math.ceil(
+                round((crossings.max() - t_min) / step, 6)) * step
+            if high <= low:
+                high = low + step
+            windows.append((max(t_min, low), min(t_max, high)))
+        return windows
+
+    def union(self, windows):
+        windows = [window for window in windows if window is not None]
+        if not windows:
+            return None
+        return (min(low for low, high in windows),
+                max(high for low, high in windows))
+
+    def melt(self, seq_a, seq_b, conditions):
+        return self.melt_many([(seq_a, seq_b)], conditions)[0]
+
+    def melt_snp(self, seq_a, seq_b, seq_am, seq_bm, conditions):
+        return tuple(self.melt_many([(seq_a, seq_b),
+                                     (seq_a, seq_bm),
+                                     (seq_am, seq_bm),
+                                     (seq_am, seq_b)], conditions))
+
+    def melt_many(self, pairs, conditions):
+        coarse = self.backend.melt_many(pairs,
+                                        self.coarse_conditions(conditions))
+        windows = self.windows(coarse, conditions)
+        window = self.union(windows)
+        if window is None:
+            return list(coarse)
+        indexes = [index for index, pair_window in enumerate(windows)
+                   if pair_window is not None]
+        fine = self.backend.melt_many(
+            [pairs[index] for index in indexes],
+            self.fine_conditions(conditions, window))
+        return self.merge(coarse, indexes, fine)
+
+    def merge(self, coarse, indexes, fine):
+        curves = list(coarse)
+        for index, curve in zip(indexes, fine):
+            curves[index] = meltcurve.merge_curves(coarse[index], curve)
+        return curves
+
+    async def melt_many_async(self, pairs, conditions, limiter):
+        coarse = await self.backend.melt_many_async(
+            pairs, self.coarse_conditions(conditions), limiter)
+        windows = self.windows(coarse, conditions)
+        window = self.union(windows)
+        if window is None:
+            return list(coarse)
+        indexes = [index for index, pair_window in enumerate(windows)
+                   if pair_window is not None]
+        fine = await self.backend.melt_many_async(
+            [pairs[index] for index in indexes],
+            self.fine_conditions(conditions, window),
+            limiter)
+        return self.merge(coarse, indexes, fine)
+
+
+BACKENDS = {backend.name: backend
+            for backend in (UnafoldBackend, NNBackend, StandInBackend)}
 
 
 class MeltingConditions():
     def __init__(self, unafold_path, ram_disk, t_min=30, t_max=90,
-                 t_increment=1, a_conc='2e-7', Na_conc='5e-2', Mg_conc='3e-3'):
+                 t_increment=1, a_conc='2e-7', Na_conc='5e-2', Mg_conc='3e-3',
+                 backend=None):
+        self.backend = backend if backend else UnafoldBackend()
         self.t_min = t_min
         self.t_max = t_max
         self.t_increment = t_increment
@@ -558,82 +1371,84 @@ class MeltingConditions():
         self.Mg_conc = Mg_conc
         self.unafold_path = unafold_path
         self.ram_disk = ram_disk
-        self.hybrid_ss_a = [self.unafold_path + 'hybrid-ss',
-                            '-n', 'DNA', '-t', t_min,
-                            '-i', t_increment, '-T', t_max,
-                            '-N', Na_conc, '-M', Mg_conc, 'a']
-        self.hybrid_ss_b = [self.unafold_path + 'hybrid-ss',
-                            '-n', 'DNA', '-t', t_min,
-                            '-i', t_increment, '-T', t_max,
-                            '-N', Na_conc, '-M', Mg_conc, 'b']
-        self.hybrid_ss_am = [self.unafold_path + 'hybrid-ss',
-                            '-n', 'DNA', '-t', t_min,
-                            '-i', t_increment, '-T', t_max,
-                            '-N', Na_conc, '-M', Mg_conc, 'am']
-        self.hybrid_ss_bm = [self.unafold_path + 'hybrid-ss',
-                            '-n', 'DNA', '-t', t_min,
-                            '-i', t_increment, '-T', t_max,
-                            '-N', Na_conc, '-M', Mg_conc, 'bm']
-        self.hybrid_a_b = [self.unafold_path + 'hybrid',
-                           '-n', 'DNA', '-t', t_min,
-                           '-i', t_increment, '-T', t_max,
-                           '-N', Na_conc, '-M', Mg_conc, 'a', 'b']
-        self.hybrid_a_a = [self.unafold_path + 'hybrid',
-                           '-n', 'DNA', '-t', t_min,
-                           '-i', t_increment, '-T', t_max,
-                           '-N', Na_conc, '-M', Mg_conc, 'a', 'a']
-        self.hybrid_b_b = [self.unafold_path + 'hybrid',
-                           '-n', 'DNA', '-t', t_min,
-                           '-i', t_increment, '-T', t_max,
-                           '-N', Na_conc, '-M', Mg_conc, 'b', 'b']
-
-        self.hybrid_am_am = [self.unafold_path + 'hybrid',
-                           '-n', 'DNA', '-t', t_min,
-                           '-i', t_increment, '-T', t_max,
-                           '-N', Na_conc, '-M', Mg_conc, 'am', 'am']
-        self.hybrid_bm_bm = [self.unafold_path + 'hybrid',
-                           '-n', 'DNA', '-t', t_min,
-                           '-i', t_increment, '-T', t_max,
-                           '-N', Na_conc, '-M', Mg_conc, 'bm', 'bm']
-        self.hybrid_am_bm = [self.unafold_path + 'hybrid',
-                           '-n', 'DNA', '-t', t_min,
-                           '-i', t_increment, '-T', t_max,
-                           '-N', Na_conc, '-M', Mg_conc, 'am', 'bm']
-        self.hybrid_am_b = [self.unafold_path + 'hybrid',
-                           '-n', 'DNA', '-t', t_min,
-                           '-i', t_increment, '-T', t_max,
-                           '-N', Na_conc, '-M', Mg_conc, 'am', 'b']
-        self.hybrid_a_bm = [self.unafold_path + 'hybrid',
-                           '-n', 'DNA', '-t', t_min,
-                           '-i', t_increment, '-T', t_max,
-                           '-N', Na_conc, '-M', Mg_conc, 'a', 'bm']
-        self.sbs = [self.unafold_path + 'sbs',
-                    '-n', 'DNA', 'a']
-        self.sbs_a = [self.unafold_path + 'sbs',
-                    '-n', 'DNA', 'a']
-        self.concentration_same = [self.unafold_path + 'concentration-same',
-                                   '-A', str(a_conc),
-                                   '-H', '-1.1e1', '-S', '-3.4e1', 'a']
-        self.concentration = [self.unafold_path + 'concentration',
-                              '-A', str(a_conc), '-B', str(a_conc),
-                              '-H', '-1.1e1', '-S', '-3.4e1', 'a', 'b']
-        self.concentration_a_b = [self.unafold_path + 'concentration',
-                              '-A', str(a_conc), '-B', str(a_conc),
-                              '-H', '-1.1e1', '-S', '-3.4e1', 'a', 'b']
-        self.concentration_a_bm = [self.unafold_path + 'concentration',
-                              '-A', str(a_conc), '-B', str(a_conc),
-                              '-H', '-1.1e1', '-S', '-3.4e1', 'a', 'bm']
-
-        self.sbs_am = [self.unafold_path + 'sbs',
-                    '-n', 'DNA', 'am']
-        self.concentration_am_bm = [self.unafold_path + 'concentration',
-                              '-A', str(a_conc), '-B', str(a_conc),
-                              '-H', '-1.1e1', '-S', '-3.4e1', 'am', 'bm']
-        self.concentration_am_b = [self.unafold_path + 'concentration',
-                              '-A', str(a_conc), '-B', str(a_conc),
-                              '-H', '-1.1e1', '-S', '-3.4e1', 'am', 'b']
+        self.hybrid_ss_a = self.hybrid_ss_command('a')
+        self.hybrid_ss_b = self.hybrid_ss_command('b')
+        self.hybrid_ss_am = self.hybrid_ss_command('am')
+        self.hybrid_ss_bm = self.hybrid_ss_command('bm')
+        self.hybrid_a_b = self.hybrid_command('a', 'b')
+        self.hybrid_a_a = self.hybrid_command('a', 'a')
+        self.hybrid_b_b = self.hybrid_command('b', 'b')
+
+        self.hybrid_am_am = self.hybrid_command('am', 'am')
+        self.hybrid_bm_bm = self.hybrid_command('bm', 'bm')
+        self.hybrid_am_bm = self.hybrid_command('am', 'bm')
+        self.hybrid_am_b = self.hybrid_command('am', 'b')
+        self.hybrid_a_bm = self.hybrid_command('a', 'bm')
+        self.sbs = self.sbs_command('a')
+        self.sbs_a = self.sbs_command('a')
+        self.concentration_same = self.concentration_same_command('a')
+        self.concentration = self.concentration_command('a', 'b')
+        self.concentration_a_b = self.concentration_command('a', 'b')
+        self.concentration_a_bm = self.concentration_command('a', 'bm')
+
+        self.sbs_am = self.sbs_command('am')
+        self.concentration_am_bm = self.concentration_command('am', 'bm')
+        self.concentration_am_b = self.concentration_command('am', 'b')
+
+    @property
+    def temperatures(self):
+        return nnmelt.temperatures(float(self.t_min),
+                                   float(self.t_max),
+                                   float(self.t_increment))
+
+    def workspace(self):
+        return scratch.shared_pool(self.ram_disk).workspace()
+
+    def replace(self, **changes):
+        values = {'unafold_path': self.unafold_path,
+                  'ram_disk': self.ram_disk,
+                  't_min': self.t_min,
+                  't_max': self.t_max,
+                  't_increment': self.t_increment,
+                  'a_conc': self.a_conc,
+                  'Na_conc': self.Na_conc,
+                  'Mg_conc': self.Mg_conc,
+                  'backend': self.backend,}
+        values.update(changes)
+        return MeltingConditions(**values)
+
+    def hybrid_ss_command(self, name):
+        return [self.unafold_path + 'hybrid-ss',
+                '-n', 'DNA', '-t', str(self.t_min),
+                '-i', str(self.t_increment), '-T', str(self.t_max),
+                '-N', str(self.Na_conc), '-M', str(self.Mg_conc), name]
+
+    def hybrid_command(self, name_a, name_b):
+        return [self.unafold_path + 'hybrid',
+                '-n', 'DNA', '-t', str(self.t_min),
+                '-i', str(self.t_increment), '-T', str(self.t_max),
+                '-N', str(self.Na_conc), '-M', str(self.Mg_conc),
+                name_a, name_b]
+
+    def sbs_command(self, name):
+        return [self.unafold_path + 'sbs',
+                '-n', 'DNA', name]
+
+    def concentration_same_command(self, name):
+        return [self.unafold_path + 'concentration-same',
+                '-A', str(self.a_conc),
+                '-H', '-1.1e1', '-S', '-3.4e1', name]
+
+    def concentration_command(self, name_a, name_b):
+        return [self.unafold_path + 'concentration',
+                '-A', str(self.a_conc), '-B', str(self.a_conc),
+                '-H', '-1.1e1', '-S', '-3.4e1', name_a, name_b]
 
     def fromYAML(self, conditions):
+        backend = self.backend
+        if conditions.get('backend', backend.name) != backend.name and \
+                conditions['backend'] in BACKENDS:
+            backend = BACKENDS[conditions['backend']]()
         self.__init__(unafold_path=conditions['unafold_path'],
                       ram_disk=conditions['ram_disk'],
                       t_min=conditions['t_min'],
@@ -641,7 +1456,28 @@ class MeltingConditions():
                       t_increment=conditions['t_increment'],
                       a_conc=conditions['a_conc'],
                       Na_conc=conditions['Na_conc'],
-                      Mg_conc=conditions['Mg_conc'],)
+                      Mg_conc=conditions['Mg_conc'],
+                      backend=backend,)
+
+
+def calc_t10_t90(curves, conditions):
+    if not curves:
+        return []
+    a_conc = float(conditions.a_conc)
+    grid = curves[0].t
+    if any(not np.array_equal(curve.t, grid) for curve in curves):
+        c10 = a_conc * 0.1
+        c90 = a_conc * 0.9
+        return [(ts[c10], ts[c90])
+                for ts in (calc_t_at_conc([c10, c90], curve)
+                           for curve in curves)]
+    ts = meltcurve.calc_t_at_fractions(
+        grid,
+        np.vstack([curve.conc for curve in curves]),
+        [0.1, 0.9],
+        a_conc)
+    return [tuple(None if np.isnan(t) else float(t) for t in curve_ts)
+            for curve_ts in ts]
 
 
 def calc_t_at_conc(concs, mpoints):
@@ -656,12 +1492,12 @@ def calc_t_at_conc(concs, mpoints):
 
     ts = {conc: None for conc in concs}
     num_t_founded = 0
-    for i in range(0, len(sorted_by_conc) - 2):
+    for i in range(0, len(sorted_by_conc) - 1):
         for conc in concs:
             t = check_c_X(conc,
                           sorted_by_conc[i],
                           sorted_by_conc[i + 1])
-            if t:
+            if t is not None and ts[conc] is None:
                 ts[conc] = t
                 num_t_founded += 1
                 if num_t_founded == len(concs):
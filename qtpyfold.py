@@ -0,0 +1,18 @@
+from PySide import QtCore
+
+
+class MTaskSignals(QtCore.QObject):
+    # Qt side of a pyfold.MTask: the core only calls plain callbacks,
+    # the GUI connects to these signals instead.
+    meltDone = QtCore.Signal(object)
+    meltingPotDone = QtCore.Signal(int)
+
+    def __init__(self, mtask):
+        QtCore.QObject.__init__(self)
+        self.mtask = mtask
+        mtask.pot_done = self.on_pot_done
+
+    def on_pot_done(self, mpot, ready):
+        QtCore.QCoreApplication.processEvents()
+        self.meltDone.emit(mpot)
+        self.meltingPotDone.emit(ready)
@@ -0,0 +1,159 @@
+import os
+import re
+import uuid
+import atexit
+import shutil
+import tempfile
+import threading
+import contextlib
+
+TMPFS_CANDIDATES = ('/dev/shm', '/run/shm')
+POOL_PREFIX = 'pyfold-'
+POOL_PATTERN = re.compile(re.escape(POOL_PREFIX) + r'(?P<pid>\d+)-[0-9a-f]+$')
+POOL_SIZE = 8
+POOL_QUOTA = 512 * 1024 * 1024
+
+
+class ScratchQuotaError(Exception):
+    pass
+
+
+def default_root():
+    for candidate in TMPFS_CANDIDATES:
+        if os.path.isdir(candidate) and os.access(candidate, os.W_OK):
+            return candidate
+    return tempfile.gettempdir()
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def dir_usage(path):
+    # entries may vanish while we look, they count as 0
+    usage = 0
+    try:
+        entries = list(os.scandir(path))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                usage += dir_usage(entry.path)
+            else:
+                usage += entry.stat(follow_symlinks=False).st_size
+        except FileNotFoundError:
+            pass
+    return usage
+
+
+def clear_dir(path):
+    # returns the bytes freed
+    freed = 0
+    for entry in os.scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            freed += dir_usage(entry.path)
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            freed += entry.stat(follow_symlinks=False).st_size
+            os.unlink(entry.path)
+    return freed
+
+
+def clean_orphans(root):
+    removed = []
+    for entry in os.scandir(root):
+        match = POOL_PATTERN.match(entry.name)
+        if match and entry.is_dir(follow_symlinks=False) and \
+                not pid_alive(int(match.group('pid'))):
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed.append(entry.path)
+    return removed
+
+
+class ScratchPool():
+    # The quota is checked against a running count kept under the lock:
+    # every checked out workspace reserves the largest workspace size seen
+    # so far (measured while clearing it on release), so acquire never
+    # walks the pool.
+    def __init__(self, root=None, size=POOL_SIZE, quota=POOL_QUOTA):
+        self.root = root if root else default_root()
+        self.size = size
+        self.quota = quota
+        os.makedirs(self.root, exist_ok=True)
+        self.orphans = clean_orphans(self.root)
+        self.path = os.path.join(self.root, '{prefix}{pid}-{id}'.format(
+            prefix=POOL_PREFIX, pid=os.getpid(), id=uuid.uuid4().hex[:8]))
+        os.mkdir(self.path)
+        self.__lock = threading.Lock()
+        self.__reserved = {}
+        self.__usage = 0
+        self.__peak = 0
+        self.__free = [self.__new_dir() for _ in range(size)]
+        atexit.register(self.close)
+
+    def __new_dir(self):
+        path = os.path.join(self.path, uuid.uuid4().hex)
+        os.mkdir(path)
+        return path
+
+    def usage(self):
+        # bytes reserved by the workspaces checked out right now
+        with self.__lock:
+            return self.__usage
+
+    def acquire(self):
+        with self.__lock:
+            if self.quota and self.__usage + self.__peak > self.quota:
+                raise ScratchQuotaError(
+                    '{path} would use more than {quota} bytes'.format(
+                        path=self.path, quota=self.quota))
+            path = self.__free.pop() if self.__free else None
+            if path is None:
+                path = self.__new_dir()
+            self.__reserved[path] = self.__peak
+            self.__usage += self.__peak
+        return path
+
+    def release(self, path):
+        try:
+            freed = clear_dir(path)
+        except OSError:
+            freed = None
+        with self.__lock:
+            self.__usage -= self.__reserved.pop(path, 0)
+            if freed is not None:
+                self.__peak = max(self.__peak, freed)
+            if freed is not None and len(self.__free) < self.size:
+                self.__free.append(path)
+                return
+        shutil.rmtree(path, ignore_errors=True)
+
+    @contextlib.contextmanager
+    def workspace(self):
+        path = self.acquire()
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def close(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def shared_pool(root=None):
+    key = (os.getpid(), root if root else default_root())
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ScratchPool(key[1])
+        return _pools[key]
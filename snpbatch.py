@@ -0,0 +1,205 @@
+import os
+import sys
+import argparse
+import concurrent.futures
+
+from pyfold import MTask
+from pyfold import MeltingConditions
+from pyfold import CachedBackend
+from pyfold import BACKENDS
+from pyfold import UnafoldBackend
+from pyfold import AdaptiveBackend
+from pyfold import Prescreen
+from pyfold import PRESCREEN_MARGIN
+from meltcache import MeltCache
+import snpproject
+import snpjournal
+import snpdb
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Design SNP probes for every name<TAB>sequence line '
+                    'of a batch file.')
+    parser.add_argument('batch', help='tab separated name/sequence file')
+    parser.add_argument('--probe-min', type=int, required=True)
+    parser.add_argument('--probe-max', type=int, required=True)
+    parser.add_argument('--projects', metavar='DIR',
+                        help='write one project file per task into DIR')
+    parser.add_argument('--yaml', action='store_true',
+                        help='write YAML instead of binary project files')
+    parser.add_argument('--table', metavar='FILE',
+                        help='write all probes into one tab separated FILE')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='tasks melted in parallel (default: %(default)s)')
+    parser.add_argument('--db', metavar='FILE',
+                        help='also index all results into this database')
+    parser.add_argument('--journal', metavar='FILE',
+                        help='resume journal (default: BATCH.journal)')
+    parser.add_argument('--no-journal', action='store_true')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='melting threads per task (default: %(default)s)')
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        default='unafold')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='coarse sweep, then a fine sweep around the '
+                             'transition only')
+    parser.add_argument('--cache', metavar='FILE',
+                        help='sqlite melt cache shared by all jobs')
+    parser.add_argument('--prescreen-t10', type=snpdb.parse_range,
+                        metavar='MIN:MAX',
+                        help='skip candidates whose estimated t10 is '
+                             'outside MIN:MAX')
+    parser.add_argument('--prescreen-t90', type=snpdb.parse_range,
+                        metavar='MIN:MAX',
+                        help='skip candidates whose estimated t90 is '
+                             'outside MIN:MAX')
+    parser.add_argument('--prescreen-margin', type=float,
+                        default=PRESCREEN_MARGIN,
+                        help='slack for the estimate (default: %(default)s)')
+    parser.add_argument('--unafold-path', default='')
+    parser.add_argument('--unafold-batched', action='store_true',
+                        help='one hybrid-ss and one hybrid run per chunk '
+                             'on multi-record inputs')
+    parser.add_argument('--ram-disk', default=None)
+    parser.add_argument('--t-min', default='30')
+    parser.add_argument('--t-max', default='90')
+    parser.add_argument('--t-increment', default='1')
+    parser.add_argument('--a-conc', default='2.0e-07')
+    parser.add_argument('--na-conc', default='5.0e-02')
+    parser.add_argument('--mg-conc', default='3.0e-03')
+    args = parser.parse_args(argv)
+    if not args.projects and not args.table and not args.db:
+        parser.error('nothing to write, use --projects, --table or --db')
+    if args.adaptive and args.backend == UnafoldBackend.name:
+        parser.error('--adaptive adds a second UNAFold pipeline per chunk, '
+                     'use it with the nn or stand-in backend')
+    if args.no_journal:
+        args.journal = None
+    elif not args.journal:
+        args.journal = args.batch + '.journal'
+    return args
+
+
+def conditions_from_args(args):
+    cache = MeltCache(args.cache) if args.cache else None
+    if args.backend == UnafoldBackend.name:
+        # the cache also keeps the hybrid-ss/hybrid outputs, so another
+        # --a-conc only reruns the concentration stage
+        backend = UnafoldBackend(batched=args.unafold_batched, stages=cache)
+    else:
+        backend = BACKENDS[args.backend]()
+    if args.adaptive:
+        backend = AdaptiveBackend(backend)
+    if cache:
+        backend = CachedBackend(backend, cache)
+    return MeltingConditions(args.unafold_path, args.ram_disk,
+                             args.t_min, args.t_max, args.t_increment,
+                             args.a_conc, args.na_conc, args.mg_conc,
+                             backend)
+
+
+def prescreen_from_args(args, conditions):
+    if not args.prescreen_t10 and not args.prescreen_t90:
+        return None
+    return Prescreen(conditions,
+                     args.prescreen_t10 or (None, None),
+                     args.prescreen_t90 or (None, None),
+                     args.prescreen_margin)
+
+
+def run_task(name, task, probe_min, probe_max, conditions, threads,
+             journal=None, key=None, restored=(), prescreen=None):
+    mtask = MTask(task)
+    mtask.restore(restored)
+    mtask.prescreen = prescreen
+    if journal is not None:
+        journal.attach(key, mtask)
+    mtask.execute(conditions, workers=threads)
+    if prescreen is not None:
+        print('{name}: pruned {pruned} of {total} candidates'.format(
+            name=name, pruned=mtask.pruned, total=mtask.pot_count),
+            file=sys.stderr)
+    if journal is not None:
+        journal.record_task(key, name)
+    return snpproject.Project.from_mtask(name, mtask, probe_min, probe_max,
+                                         conditions)
+
+
+def submit_tasks(executor, args, conditions, journal):
+    prescreen = prescreen_from_args(args, conditions)
+    futures = {}
+    for name, sequence in snpproject.read_batch(args.batch):
+        task = snpproject.batch_task(sequence, args.probe_min, args.probe_max)
+        key = snpjournal.task_key(task, conditions)
+        restored = []
+        task_journal = journal
+        if journal is not None:
+            restored = journal.pots(key)
+            if journal.is_done(key):
+                task_journal = None
+                print('{name}: done, rebuilt from journal'.format(name=name),
+                      file=sys.stderr)
+            elif restored:
+                print('{name}: resuming after {n} pots'.format(
+                    name=name, n=len(restored)), file=sys.stderr)
+        futures[executor.submit(run_task, name, task,
+                                args.probe_min, args.probe_max,
+                                conditions, args.threads,
+                                task_journal, key, restored,
+                                prescreen)] = name
+    return futures
+
+
+def run_batch(args):
+    conditions = conditions_from_args(args)
+    journal = snpjournal.Journal(args.journal) if args.journal else None
+    results = snpdb.ResultsDB(args.db) if args.db else None
+    if args.projects:
+        os.makedirs(args.projects, exist_ok=True)
+    table = open(args.table, 'w') if args.table else None
+    failed = 0
+    try:
+        if table:
+            print('\t'.join(snpproject.TABLE_COLUMNS), file=table)
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=args.jobs) as executor:
+            futures = submit_tasks(executor, args, conditions, journal)
+            for future in concurrent.futures.as_completed(futures):
+                name = futures.pop(future)
+                try:
+                    project = future.result()
+                except Exception as error:
+                    failed += 1
+                    print('{name}: {error!r}'.format(name=name, error=error),
+                          file=sys.stderr)
+                    continue
+                filename = None
+                if args.projects:
+                    filename = os.path.join(args.projects, name)
+                    if args.yaml:
+                        snpproject.save_project(filename, project.dump())
+                    else:
+                        project.save(filename)
+                if results:
+                    results.add_project(project, filename)
+                if table:
+                    for row in snpproject.table_rows(project):
+                        print(snpproject.format_row(row), file=table)
+                print(name, file=sys.stderr)
+    finally:
+        if table:
+            table.close()
+        if journal is not None:
+            journal.close()
+        if results:
+            results.close()
+    return failed
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.exit(1 if run_batch(args) else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+
+import numpy as np
+
+import snpproject
+
+RANGE_FIELDS = ('t10', 't90', 'dt10', 'dt90', 'dt90t10', 'length', 'position')
+RESULT_COLUMNS = ('name', 'tab', 'position', 'length', 'sequence',
+                  't10', 't90', 'dt10', 'dt90', 'dt90t10')
+
+
+def nullable(values):
+    return [None if np.isnan(value) else float(value) for value in values]
+
+
+class ResultsDB():
+    # One row per probe and tab (A, B, Am, Bm) of every indexed project,
+    # with the same t/dt values snpick shows on its filter tabs.
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self.__db = sqlite3.connect(path, timeout=timeout,
+                                    isolation_level=None)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute('PRAGMA synchronous=NORMAL')
+        self.__db.execute('PRAGMA foreign_keys=ON')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS projects ('
+                          'id INTEGER PRIMARY KEY, '
+                          'name TEXT NOT NULL, '
+                          'task TEXT NOT NULL, '
+                          'probe_min INTEGER, '
+                          'probe_max INTEGER, '
+                          'conditions TEXT, '
+                          'source TEXT UNIQUE, '
+                          'saved REAL NOT NULL)')
+        self.__db.execute('CREATE INDEX IF NOT EXISTS projects_name '
+                          'ON projects (name)')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS probes ('
+                          'project INTEGER NOT NULL '
+                          'REFERENCES projects (id) ON DELETE CASCADE, '
+                          'tab TEXT NOT NULL, '
+                          'sequence TEXT NOT NULL, '
+                          'position INTEGER, '
+                          'length INTEGER, '
+                          't10 REAL, '
+                          't90 REAL, '
+                          'dt10 REAL, '
+                          'dt90 REAL, '
+                          'dt90t10 REAL)')
+        self.__db.execute('CREATE INDEX IF NOT EXISTS probes_project '
+                          'ON probes (project)')
+        for field in RANGE_FIELDS:
+            self.__db.execute('CREATE INDEX IF NOT EXISTS probes_{field} '
+                              'ON probes ({field})'.format(field=field))
+
+    def close(self):
+        self.__db.close()
+
+    def add_project(self, project, source=None):
+        # replaces what was indexed from the same source file; projects
+        # without a file replace the file-less one of the same name
+        db = self.__db
+        if source is not None:
+            source = os.path.abspath(source)
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if source is not None:
+                db.execute('DELETE FROM projects WHERE source = ?',
+                           (source,))
+            else:
+                db.execute('DELETE FROM projects '
+                           'WHERE source IS NULL AND name = ?',
+                           (project.name,))
+            project_id = db.execute(
+                'INSERT INTO projects (name, task, probe_min, probe_max, '
+                'conditions, source, saved) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (project.name, project.task, int(project.probe_min),
+                 int(project.probe_max), json.dumps(project.conditions),
+                 source, time.time())).lastrowid
+            for tab in snpproject.TABS:
+                columns = snpproject.tab_columns(project, tab)
+                db.executemany(
+                    'INSERT INTO probes (project, tab, sequence, position, '
+                    'length, t10, t90, dt10, dt90, dt90t10) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    zip([project_id] * len(project),
+                        [tab] * len(project),
+                        np.char.decode(columns['sequence']).tolist(),
+                        columns['position'].tolist(),
+                        columns['length'].tolist(),
+                        *(nullable(columns[field])
+                          for field in ('t10', 't90',
+                                        'dt10', 'dt90', 'dt90t10'))))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return project_id
+
+    def remove_project(self, name, source=None):
+        if source is not None:
+            self.__db.execute('DELETE FROM projects WHERE source = ?',
+                              (os.path.abspath(source),))
+        else:
+            self.__db.execute('DELETE FROM projects WHERE name = ?', (name,))
+
+    def projects(self):
+        return [row[0] for row in self.__db.execute(
+            'SELECT name FROM projects ORDER BY name')]
+
+    def query(self, name=None, tab=None, limit=None, **ranges):
+        # ranges: field=(min, max) for RANGE_FIELDS, either end may be None
+        where = []
+        args = []
+        if name is not None:
+            where.append('projects.name GLOB ?')
+            args.append(name)
+        if tab is not None:
+            where.append('probes.tab = ?')
+            args.append(tab)
+        for field, (low, high) in ranges.items():
+            if field not in RANGE_FIELDS:
+                raise ValueError('unknown field {field}'.format(field=field))
+            if low is not None:
+                where.append('probes.{field} >= ?'.format(field=field))
+                args.append(low)
+            if high is not None:
+                where.append('probes.{field} <= ?'.format(field=field))
+                args.append(high)
+        sql = 'SELECT {columns} FROM probes ' \
+              'JOIN projects ON projects.id = probes.project'.format(
+                  columns=', '.join(RESULT_COLUMNS))
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY projects.name, probes.tab, probes.position'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            args.append(limit)
+        return self.__db.execute(sql, args)
+
+
+def parse_range(text):
+    # 'min:max', 'min:' or ':max'; a single number means exactly that value
+    low, sep, high = text.partition(':')
+    if not sep:
+        high = low
+    return (float(low) if low else None, float(high) if high else None)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Index snpick projects and search probes across them.')
+    parser.add_argument('db', help='results database')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    index = commands.add_parser('index', help='add project files')
+    index.add_argument('projects', nargs='+', metavar='PROJECT')
+    query = commands.add_parser('query', help='print matching probes as TSV')
+    query.add_argument('--name', help='project name glob')
+    query.add_argument('--tab', choices=sorted(snpproject.TABS))
+    query.add_argument('--limit', type=int)
+    for field in RANGE_FIELDS:
+        query.add_argument('--' + field, type=parse_range, metavar='MIN:MAX')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db = ResultsDB(args.db)
+    try:
+        if args.command == 'index':
+            for filename in args.projects:
+                if os.path.isdir(filename):
+                    continue
+                try:
+                    project = snpproject.open_project(filename)
+                    db.add_project(project, os.path.abspath(filename))
+                except Exception as error:
+                    print('{filename}: {error!r}'.format(filename=filename,
+                                                         error=error),
+                          file=sys.stderr)
+        else:
+            ranges = {field: getattr(args, field) for field in RANGE_FIELDS
+                      if getattr(args, field) is not None}
+            print('\t'.join(RESULT_COLUMNS))
+            for row in db.query(args.name, args.tab, args.limit, **ranges):
+                print(snpproject.format_row(row))
+    finally:
+        db.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,49 @@
+import os
 import sys
+import math
 from enum import Enum
-import yaml
-import pickle
+
+import numpy as np
 
 from PySide import QtCore
 from PySide import QtGui
 from PySide import QtNetwork
 
 from pyfold import MTask
+from qtpyfold import MTaskSignals
 from pyfold import MeltingConditions
+from pyfold import UnafoldBackend
+from pyfold import CachedBackend
+from pyfold import Prescreen
+from meltcache import MeltCache
+import snpproject
+import snpjournal
+import snpdb
 
 PROJECTS_FOLDER = '/home/kablag/Документы/snpick/'
 UNAFOLD_PATH = ''
-RAM_DISK = '/home/kablag/.ramdisk/'
+RAM_DISK = None
+MELT_CACHE = '/home/kablag/.cache/snpick/melts.sqlite'
+# skip candidates the NN estimate puts outside the A tab t10/t90 windows
+PRESCREEN = False
+RESULTS_DB = '/home/kablag/.cache/snpick/results.sqlite'
 
 SLIDER_RATE = 10
+FILTER_DELAY = 150
+WINDOW_TITLE = 'snpick'
+CELL_FLAGS = QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+# widest text expected in the numeric columns, e.g. '-12.3' or 'None'
+NUMBER_WIDTH = 6
 
 A_CONC = '2.0e-07'
 C_10 = float(A_CONC) * 0.1
 C_90 = float(A_CONC) * 0.9
 
+M_CACHE = MeltCache(MELT_CACHE)
 M_CONDS = MeltingConditions(UNAFOLD_PATH, RAM_DISK, '30', '90',
-                            '1', A_CONC, '5.0e-02', '3.0e-03')
+                            '1', A_CONC, '5.0e-02', '3.0e-03',
+                            CachedBackend(UnafoldBackend(stages=M_CACHE),
+                                          M_CACHE))
 
 class COLUMNS(Enum):
     ID = 0
@@ -76,95 +98,190 @@ class TempSelectWidget(QtGui.QWidget):
         return self.__sliderValue
 
 
-class MyTableWidget(QtGui.QTableWidget):
-    def __init__(self, rows, columns, parent=None):
-        super(MyTableWidget, self).__init__(rows, columns, parent)
+class MyTableView(QtGui.QTableView):
+    def __init__(self, parent=None):
+        super(MyTableView, self).__init__(parent)
         self.setSortingEnabled(True)
 
     def keyPressEvent(self, event):
         if event.matches(QtGui.QKeySequence.Copy):
             self.copy()
         else:
-            QtGui.QTableWidget.keyPressEvent(self, event)
+            QtGui.QTableView.keyPressEvent(self, event)
 
     def copy(self):
-        text = []
-        selectionRanges = self.selectedRanges()
-        for selRange in selectionRanges:
-            rows = []
-            for row in range(selRange.topRow(),
-                             selRange.topRow() + selRange.rowCount()):
-                columns = []
-                for col in range(selRange.leftColumn(),
-                                 selRange.leftColumn() +
-                                         selRange.columnCount()):
-                    columns.append(self.item(row,col).text())
-                columns = '\t'.join(columns)
-                rows.append(columns)
-            text.append('\n'.join(rows))
-        text = '\n'.join(text)
+        indexes = sorted(self.selectionModel().selectedIndexes(),
+                         key=lambda index: (index.row(), index.column()))
+        rows = []
+        last_row = None
+        for index in indexes:
+            if index.row() != last_row:
+                rows.append([])
+                last_row = index.row()
+            rows[-1].append(index.data())
+        text = '\n'.join('\t'.join(columns) for columns in rows)
         QtGui.QApplication.clipboard().setText(text)
 
 
-class MyTableItem(QtGui.QTableWidgetItem):
-    def __init__(self, text=''):
-        super(MyTableItem, self).__init__(text)
-        self.setFlags(QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable)
-        self.setTextAlignment(QtCore.Qt.AlignCenter)
-        self.setFont(QtGui.QFont('Ubuntu Mono'))
+class ProbeTableModel(QtCore.QAbstractTableModel):
+    # Read-only view over the numeric columns of one snpick tab
+    # (snpproject.tab_columns). Filtering and sorting only rebuild the
+    # numpy index of shown rows; text is only formatted for visible cells.
+    HEADERS = [name for name in COLUMNS.__members__]
+    DELTAS = (COLUMNS.Dt10, COLUMNS.Dt90, COLUMNS.Dt90t10)
+    __font = None
+
+    def __init__(self, parent=None):
+        super(ProbeTableModel, self).__init__(parent)
+        self.__tab = None
+        self.__mask = None
+        self.__sort = None
+        self.__order = None
+        self.__rows = np.arange(0)
+
+    @classmethod
+    def font(cls):
+        # one font for every cell of every tab; needs a QApplication
+        if cls.__font is None:
+            cls.__font = QtGui.QFont('Ubuntu Mono')
+        return cls.__font
+
+    @property
+    def tab(self):
+        return self.__tab
+
+    def setTab(self, tab):
+        self.beginResetModel()
+        self.__tab = tab
+        self.__mask = None
+        self.__order = self.__sorted()
+        self.__update()
+        self.endResetModel()
+
+    def setMask(self, mask):
+        # mask: one bool per tab row (snpproject.filter_mask), None for all
+        self.beginResetModel()
+        self.__mask = mask
+        self.__update()
+        self.endResetModel()
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        self.beginResetModel()
+        self.__sort = (COLUMNS(column), order)
+        self.__order = self.__sorted()
+        self.__update()
+        self.endResetModel()
+
+    def sortKey(self, column):
+        if column is COLUMNS.ID:
+            return np.arange(len(self.__tab['sequence']))
+        if column is COLUMNS.Sequence:
+            return self.__tab['sequence']
+        values = self.__tab[column.name.lower()]
+        if column in self.DELTAS:
+            # unknown dt counts as 0, unknown t sorts last
+            return np.where(np.isnan(values), 0, values)
+        return values
+
+    def __sorted(self):
+        if self.__tab is None or self.__sort is None:
+            return None
+        column, order = self.__sort
+        rows = np.argsort(self.sortKey(column), kind='stable')
+        return rows[::-1] if order == QtCore.Qt.DescendingOrder else rows
+
+    def __update(self):
+        if self.__tab is None:
+            self.__rows = np.arange(0)
+            return
+        rows = self.__order
+        if rows is None:
+            rows = np.arange(len(self.__tab['sequence']))
+        if self.__mask is not None:
+            rows = rows[self.__mask[rows]]
+        self.__rows = rows
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.__rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and \
+                orientation == QtCore.Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        return CELL_FLAGS
+
+    def value(self, row, column):
+        # row: a tab row, not a shown row
+        if column is COLUMNS.ID:
+            return row
+        if column is COLUMNS.Sequence:
+            return self.__tab['sequence'][row].decode()
+        value = self.__tab[column.name.lower()][row]
+        if column in (COLUMNS.Length, COLUMNS.Position):
+            return int(value)
+        if math.isnan(value):
+            # unknown t stays empty, unknown dt counts as 0 like before
+            return None if column in (COLUMNS.T10, COLUMNS.T90) else 0
+        return float(value)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return str(self.value(int(self.__rows[index.row()]),
+                                  COLUMNS(index.column())))
+        if role == QtCore.Qt.TextAlignmentRole:
+            return QtCore.Qt.AlignCenter
+        if role == QtCore.Qt.FontRole:
+            return self.font()
+        return None
 
 
 class FilterTab(QtGui.QWidget):
-    class Row():
-        def __init__(self,
-                     id,
-                     sequence,
-                     t10, t90,
-                     dt10, dt90,
-                     dt90t10,
-                     length,
-                     position):
-            self.id = str(id)
-            self.sequence = sequence
-            self.t10 = str(t10)
-            self.t90 = str(t90)
-            self.dt10 = str(dt10)
-            self.dt90 = str(dt90)
-            self.dt90t10 = str(dt90t10)
-            self.length = str(length)
-            self.position = str(position)
-
     def __init__(self, name):
         super(FilterTab, self).__init__()
-        self.rows = []
         self.name = name
         tab_layout = QtGui.QVBoxLayout()
         # tab_layout.setSpacing(-10)
+        self.filterTimer = QtCore.QTimer(self)
+        self.filterTimer.setSingleShot(True)
+        self.filterTimer.setInterval(FILTER_DELAY)
+        self.filterTimer.timeout.connect(self.filterRows)
         self.t10Min = TempSelectWidget('t10 min', 0)
-        self.t10Min.slider.valueChanged.connect(self.filterRows)
+        self.t10Min.slider.valueChanged.connect(self.filterTimer.start)
         self.t10Max = TempSelectWidget('t10 max', 75)
-        self.t10Max.slider.valueChanged.connect(self.filterRows)
+        self.t10Max.slider.valueChanged.connect(self.filterTimer.start)
         self.t90Min = TempSelectWidget('t90 min', 50)
-        self.t90Min.slider.valueChanged.connect(self.filterRows)
+        self.t90Min.slider.valueChanged.connect(self.filterTimer.start)
         self.t90Max = TempSelectWidget('t90 max', 90)
-        self.t90Max.slider.valueChanged.connect(self.filterRows)
+        self.t90Max.slider.valueChanged.connect(self.filterTimer.start)
         self.minDelta_t10 = TempSelectWidget('min dt10',0)
-        self.minDelta_t10.slider.valueChanged.connect(self.filterRows)
+        self.minDelta_t10.slider.valueChanged.connect(self.filterTimer.start)
         self.minDelta_t90 = TempSelectWidget('min dt90',0)
-        self.minDelta_t90.slider.valueChanged.connect(self.filterRows)
+        self.minDelta_t90.slider.valueChanged.connect(self.filterTimer.start)
         self.minDelta_t10t90 = TempSelectWidget('min dt90t10',0)
         self.minDelta_t10t90.slider.setMinimum(-20 * SLIDER_RATE)
         self.minDelta_t10t90.slider.setMaximum(10 * SLIDER_RATE)
         self.minDelta_t10t90.slider.setValue(-10 * SLIDER_RATE)
-        self.minDelta_t10t90.slider.valueChanged.connect(self.filterRows)
+        self.minDelta_t10t90.slider.valueChanged.connect(
+            self.filterTimer.start)
 
-        self.dataTable = MyTableWidget(0, len(COLUMNS))
+        self.model = ProbeTableModel(self)
+        self.dataTable = MyTableView()
+        self.dataTable.setModel(self.model)
         sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Expanding)
         self.dataTable.setSizePolicy(sizePolicy)
-        self.dataTable.setHorizontalHeaderLabels(
-            [name for name, member in COLUMNS.__members__.items()])
-        self.dataTable.setHidden(COLUMNS.ID.value)
-        self.dataTable.resizeColumnsToContents()
+        self.dataTable.setColumnHidden(COLUMNS.ID.value, True)
+        self.dataTable.setFont(ProbeTableModel.font())
+        rows = self.dataTable.verticalHeader()
+        rows.setResizeMode(QtGui.QHeaderView.Fixed)
+        rows.setDefaultSectionSize(self.dataTable.fontMetrics().height() + 4)
         tab_layout.addWidget(self.t10Min)
         tab_layout.addWidget(self.t10Max)
         tab_layout.addWidget(self.t90Min)
@@ -176,174 +293,40 @@ class FilterTab(QtGui.QWidget):
         self.setLayout(tab_layout)
 
     def filterRows(self):
-        for i in range(0, self.dataTable.rowCount()):
-
-            if float(self.dataTable.item(i,
-                COLUMNS.T10.value).text()) \
-                    >= self.t10Min.sliderValue()  and \
-                float(self.dataTable.item(i,
-                COLUMNS.T10.value).text()) \
-                    <= self.t10Max.sliderValue() and \
-                float(self.dataTable.item(i,
-                COLUMNS.T90.value).text()) \
-                    >= self.t90Min.sliderValue() and \
-                float(self.dataTable.item(i,
-                COLUMNS.T90.value).text()) \
-                    <= self.t90Max.sliderValue() and \
-                    (float(self.dataTable.item(i,
-                COLUMNS.Dt10.value).text()) \
-                    >= self.minDelta_t10.sliderValue() or \
-                    float(self.dataTable.item(i, COLUMNS.Dt10.value).text()) == 0) and \
-                (float(self.dataTable.item(i,
-                COLUMNS.Dt90.value).text()) \
-                    >= self.minDelta_t90.sliderValue() or \
-                    float(self.dataTable.item(i, COLUMNS.Dt90.value).text()) == 0) and \
-                (float(self.dataTable.item(i,
-                COLUMNS.Dt90t10.value).text()) \
-                    >= self.minDelta_t10t90.sliderValue() or \
-                    float(self.dataTable.item(i, COLUMNS.Dt90t10.value).text()) == 0):
-                self.dataTable.showRow(i)
-            else:
-                self.dataTable.hideRow(i)
-        self.dataTable.resizeColumnsToContents()
-
-
-
-    def addData(self, mtask:MTask):
-        melts_to_show = mtask.melting_pots
-
-        def add_row(melt_show_mpot, id):
-            pos = melt_show_mpot.position
-            if self.name == 'A':
-                sequence = melt_show_mpot.a
-                t10 = melt_show_mpot.t10_AB
-                t90 = melt_show_mpot.t90_AB
-                try:
-                    dt10 = melt_show_mpot.t10_AB - melt_show_mpot.t10_ABm
-                except TypeError:
-                    dt10 = 0
-                try:
-                    dt90 = melt_show_mpot.t90_AB - melt_show_mpot.t90_ABm
-                except TypeError:
-                    dt90 = 0
-                try:
-                    dt90t10 = melt_show_mpot.t90_AB - melt_show_mpot.t10_ABm
-                except TypeError:
-                    dt90t10 = 0
-            elif self.name == 'B':
-                sequence = melt_show_mpot.b
-                t10 = melt_show_mpot.t10_AB
-                t90 = melt_show_mpot.t90_AB
-                try:
-                    dt10 = melt_show_mpot.t10_AB - melt_show_mpot.t10_AmB
-                except TypeError:
-                    dt10 = 0
-                try:
-                    dt90 = melt_show_mpot.t90_AB - melt_show_mpot.t90_AmB
-                except TypeError:
-                    dt90 = 0
-                try:
-                    dt90t10 = melt_show_mpot.t90_AB - melt_show_mpot.t10_AmB
-                except TypeError:
-                    dt90t10 = 0
-            elif self.name == 'Am':
-                sequence = melt_show_mpot.am
-                t10 = melt_show_mpot.t10_AmBm
-                t90 = melt_show_mpot.t90_AmBm
-                try:
-                    dt10 = melt_show_mpot.t10_AmBm - melt_show_mpot.t10_AmB
-                except TypeError:
-                    dt10 = 0
-                try:
-                    dt90 = melt_show_mpot.t90_AmBm - melt_show_mpot.t90_AmB
-                except TypeError:
-                    dt90 = 0
-                try:
-                    dt90t10 = melt_show_mpot.t90_AmBm - melt_show_mpot.t10_AmB
-                except TypeError:
-                    dt90t10 = 0
-            else:
-                sequence = melt_show_mpot.bm
-                t10 = melt_show_mpot.t10_AmBm
-                t90 = melt_show_mpot.t90_AmBm
-                try:
-                    dt10 = melt_show_mpot.t10_AmBm - melt_show_mpot.t10_ABm
-                except TypeError:
-                    dt10 = 0
-                try:
-                    dt90 = melt_show_mpot.t90_AmBm - melt_show_mpot.t90_ABm
-                except TypeError:
-                    dt90 = 0
-                try:
-                    dt90t10 = melt_show_mpot.t90_AmBm - melt_show_mpot.t10_ABm
-                except TypeError:
-                    dt90t10 = 0
-            try:
-                dt10 = round(dt10, 1)
-            except TypeError:
-                dt10 = 0
-            try:
-                dt90 = round(dt90, 1)
-            except TypeError:
-                dt90 = 0
-            try:
-                dt90t10 = round(dt90t10, 1)
-            except TypeError:
-                dt90t10 = 0
-            return FilterTab.Row(id, sequence,
-                                     t10, t90,
-                                     dt10, dt90,
-                                     dt90t10,
-                                     melt_show_mpot.length_of_a,
-                                     pos)
-        id = 0
-        self.rows = []
-        for mp in melts_to_show:
-            self.rows.append(add_row(mp, id))
-            id+=1
-        self.showDataInTable()
+        if self.model.tab is None:
+            return
+        self.model.setMask(snpproject.filter_mask(
+            self.model.tab,
+            self.t10Min.sliderValue(), self.t10Max.sliderValue(),
+            self.t90Min.sliderValue(), self.t90Max.sliderValue(),
+            self.minDelta_t10.sliderValue(),
+            self.minDelta_t90.sliderValue(),
+            self.minDelta_t10t90.sliderValue()))
+
+    def addData(self, columns):
+        # columns: snpproject.mtask_columns(), shared by all four tabs
+        tab = snpproject.tab_columns(columns, self.name)
+        self.model.setTab(tab)
         self.filterRows()
-
-    def showDataInTable(self):
-        self.dataTable = MyTableWidget(0, len(COLUMNS))
-        sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Expanding)
-        self.dataTable.setSizePolicy(sizePolicy)
-        self.dataTable.setHorizontalHeaderLabels(
-            [name for name, member in COLUMNS.__members__.items()])
-        self.dataTable.setHidden(COLUMNS.ID.value)
-        self.dataTable.resizeColumnsToContents()
-        self.dataTable.setSortingEnabled(False)
-
-        # self.dataTable.clearContents()
-
-        for d_row in self.rows:
-            self.dataTable.insertRow(0)
-            self.dataTable.setItem(0, COLUMNS.ID.value,
-                                   MyTableItem(d_row.id))
-            self.dataTable.setItem(0, COLUMNS.Sequence.value,
-                                   MyTableItem(d_row.sequence))
-            self.dataTable.setItem(0, COLUMNS.T10.value,
-                                   MyTableItem(d_row.t10))
-            self.dataTable.setItem(0, COLUMNS.T90.value,
-                                   MyTableItem(d_row.t90))
-            self.dataTable.setItem(0, COLUMNS.Dt10.value,
-                                   MyTableItem(d_row.dt10))
-            self.dataTable.setItem(0, COLUMNS.Dt90.value,
-                                   MyTableItem(d_row.dt90))
-            self.dataTable.setItem(0, COLUMNS.Dt90t10.value,
-                                   MyTableItem(d_row.dt90t10))
-            self.dataTable.setItem(0, COLUMNS.Length.value,
-                                   MyTableItem(d_row.length))
-            self.dataTable.setItem(0, COLUMNS.Position.value,
-                                   MyTableItem(d_row.position))
-        self.dataTable.setHorizontalHeaderLabels(
-            [name for name, member in COLUMNS.__members__.items()])
-        self.dataTable.setSortingEnabled(True)
+        self.fitColumns(tab)
+
+    def fitColumns(self, tab):
+        # sized from the widest possible text instead of measuring rows
+        longest = int(np.char.str_len(tab['sequence']).max()) \
+            if len(tab['sequence']) else 0
+        char_width = self.dataTable.fontMetrics().width('0')
+        for column in COLUMNS:
+            chars = longest if column is COLUMNS.Sequence else NUMBER_WIDTH
+            chars = max(chars, len(column.name))
+            self.dataTable.setColumnWidth(column.value,
+                                          (chars + 2) * char_width)
 
 class Snpick(QtGui.QWidget):
     def __init__(self):
         super(Snpick, self).__init__()
         self.mtask = None
+        # a loaded snpproject.Project, until the next melt
+        self.project = None
         self.init_ui()
 
     def init_ui(self):
@@ -404,36 +387,63 @@ class Snpick(QtGui.QWidget):
 
         self.setLayout(vbox)
         self.setGeometry(300, 300, 1000, 600)
+        self.setWindowTitle(WINDOW_TITLE)
         self.show()
 
     def resizeEvent(self, event):
         self.tabs.setBaseSize(self.tabs.width(),
                               event.size().height() * 0.8)
 
-    def add_data_to_tabs(self):
-        if not self.mtask.canceled:
-            self.tab_A.addData(self.mtask)
-            self.tab_B.addData(self.mtask)
-            self.tab_Am.addData(self.mtask)
-            self.tab_Bm.addData(self.mtask)
-
-    def onCalcProbesClicked(self):
-        mtask = '{sequence}{min_p}->{max_p}'.format(
-            sequence=self.seqInput.text(),
-            min_p=self.probeMin.text(),
-            max_p=self.probeMax.text(),
-        )
-        self.mtask = MTask(mtask)
+    def add_data_to_tabs(self, columns=None):
+        # columns: a loaded Project, by default those of the melted mtask
+        if columns is None:
+            if self.mtask.canceled:
+                return
+            columns = snpproject.mtask_columns(self.mtask)
+        self.tab_A.addData(columns)
+        self.tab_B.addData(columns)
+        self.tab_Am.addData(columns)
+        self.tab_Bm.addData(columns)
+
+    def onCalcProbesClicked(self, journal=None):
+        task = snpproject.batch_task(self.seqInput.text(),
+                                     self.probeMin.text(),
+                                     self.probeMax.text())
+        self.mtask = MTask(task)
+        self.project = None
         self.seqInput.setText(self.mtask.task)
-        self.mtask.meltingPotDone.connect(self.on_mpot_done)
+        self.mtask_signals = MTaskSignals(self.mtask)
+        self.mtask_signals.meltingPotDone.connect(self.on_mpot_done)
+        if journal:
+            key = snpjournal.task_key(task, M_CONDS)
+            self.mtask.restore(journal.pots(key))
+            journal.attach(key, self.mtask)
+        if PRESCREEN:
+            self.mtask.prescreen = Prescreen(
+                M_CONDS,
+                (self.tab_A.t10Min.sliderValue(),
+                 self.tab_A.t10Max.sliderValue()),
+                (self.tab_A.t90Min.sliderValue(),
+                 self.tab_A.t90Max.sliderValue()))
         self.pd = QtGui.QProgressDialog('Melting probes',
                                         'Cancel',
                                         0,
-                                        len(self.mtask.melting_pots))
+                                        self.mtask.pot_count)
         self.pd.setWindowModality(QtCore.Qt.WindowModal)
         self.calcProbes.setEnabled(False)
         self.pd.canceled.connect(self.cancel_melting)
         self.mtask.execute(M_CONDS)
+        # pruned candidates never report progress, close the dialog anyway
+        self.pd.reset()
+        if self.mtask.prescreen is not None:
+            self.setWindowTitle(
+                '{title} - {name}: pruned {pruned} of {total} '
+                'candidates'.format(title=WINDOW_TITLE,
+                                    name=self.name.text(),
+                                    pruned=self.mtask.pruned,
+                                    total=self.mtask.pot_count))
+        else:
+            self.setWindowTitle(WINDOW_TITLE)
         self.calcProbes.setEnabled(True)
         self.add_data_to_tabs()
 
@@ -442,68 +452,58 @@ class Snpick(QtGui.QWidget):
                                                      'Save project',
                                                      PROJECTS_FOLDER+self.name.text())
         if filename != '':
-            with open(filename, 'w') as f:
-                # print(yaml.dump(self.mtask.melting_pots), file=f)
-                # pickle.dump(self.mtask, f)
-
-                conditions = {'unafold_path': M_CONDS.unafold_path,
-                              'ram_disk': M_CONDS.ram_disk,
-                              't_min': M_CONDS.t_min,
-                              't_max': M_CONDS.t_max,
-                              't_increment': M_CONDS.t_increment,
-                              'a_conc': M_CONDS.a_conc,
-                              'Na_conc': M_CONDS.Na_conc,
-                              'Mg_conc': M_CONDS.Mg_conc,}
-                mpots = [{'A':mpot.a,
-                          'B':mpot.b,
-                          'Am':mpot.am,
-                          'Bm':mpot.bm,
-                          'position':mpot.position,
-                          't10_AB':mpot.t10_AB,
-                          't10_ABm':mpot.t10_ABm,
-                          't10_AmBm':mpot.t10_AmBm,
-                          't10_AmB':mpot.t10_AmB,
-                          't90_AB':mpot.t90_AB,
-                          't90_ABm':mpot.t90_ABm,
-                          't90_AmBm':mpot.t90_AmBm,
-                          't90_AmB':mpot.t90_AmB,} for mpot in self.mtask.melting_pots]
-                dump = {'name':self.name.text(),
-                        'task':self.mtask.task,
-                        'probeMin':self.probeMin.text(),
-                        'probeMax':self.probeMax.text(),
-                        'conditions': conditions,
-                        'mpots': mpots,}
-                print(yaml.dump(dump), file=f)
-
+            if self.project is not None:
+                project = self.project.renamed(self.name.text())
+            else:
+                project = snpproject.Project.from_mtask(self.name.text(),
+                                                       self.mtask,
+                                                       self.probeMin.text(),
+                                                       self.probeMax.text(),
+                                                       M_CONDS)
+            project.save(filename)
+            results = snpdb.ResultsDB(RESULTS_DB)
+            results.add_project(project, filename)
+            results.close()
 
     def onLoadButtonClicked(self):
         filename, filter = QtGui.QFileDialog.getOpenFileName(self,
                                                      'Load project',
                                                      '/home/kablag/Документы/snpick')
         if filename != '':
-            with open(filename, 'r') as f:
-                dump = yaml.load(f.read())
-                M_CONDS.fromYAML(dump['conditions'])
-                self.name.setText(dump['name'])
-                self.seqInput.setText(dump['task'])
-                self.probeMin.setText(dump['probeMin'])
-                self.probeMax.setText(dump['probeMax'])
-                self.mtask = MTask(dump['task'], dump)
-                self.add_data_to_tabs()
+            project = snpproject.open_project(filename)
+            M_CONDS.fromYAML(project.conditions)
+            self.name.setText(project.name)
+            self.seqInput.setText(project.task)
+            self.probeMin.setText(project.probe_min)
+            self.probeMax.setText(project.probe_max)
+            # the tabs read the (memory mapped) columns directly, an
+            # MTask is only built again by the next melt
+            self.mtask = None
+            self.project = project
+            self.add_data_to_tabs(project)
 
     def onBatchButtonClicked(self):
         filename, filter = QtGui.QFileDialog.getOpenFileName(self,
                                                      'Load batch',
                                                      PROJECTS_FOLDER)
         if filename != '':
-            with open(filename, 'r') as f:
-                tasks = f.readlines()
-                for task in tasks:
-                    name, sequence = task.split('\t')
-                    self.name.setText(name)
-                    self.seqInput.setText(sequence)
-                    self.onCalcProbesClicked()
-                    self.onSaveButtonClicked(PROJECTS_FOLDER + name)
+            journal = snpjournal.Journal(filename + '.journal')
+            for name, sequence in snpproject.read_batch(filename):
+                key = snpjournal.task_key(
+                    snpproject.batch_task(sequence,
+                                          self.probeMin.text(),
+                                          self.probeMax.text()),
+                    M_CONDS)
+                if journal.is_done(key) and \
+                        os.path.exists(PROJECTS_FOLDER + name):
+                    continue
+                self.name.setText(name)
+                self.seqInput.setText(sequence)
+                self.onCalcProbesClicked(journal)
+                self.onSaveButtonClicked(PROJECTS_FOLDER + name)
+                if not self.mtask.canceled:
+                    journal.record_task(key, name)
+            journal.close()
     @QtCore.Slot()
     def cancel_melting(self):
         self.pd.close()
@@ -0,0 +1,90 @@
+import os
+import json
+import hashlib
+import collections
+
+import meltcache
+import snpproject
+
+
+def task_key(task, conditions):
+    payload = json.dumps([task,
+                          conditions.backend.name,
+                          conditions.backend.version,
+                          meltcache.conditions_key(conditions)],
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class Journal():
+    # Append-only JSON lines: {"task": key, "mpot": {...}} for every melted
+    # pot and {"task": key, "done": name} once a task is complete. Every
+    # record is a single O_APPEND write, so worker processes can share it.
+    def __init__(self, path):
+        self.path = path
+        self.__pots = collections.defaultdict(list)
+        self.__done = set()
+        self.__fd = None
+        self.__pid = None
+        if os.path.exists(path):
+            self.load()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_Journal__pots'] = collections.defaultdict(list)
+        state['_Journal__fd'] = None
+        state['_Journal__pid'] = None
+        return state
+
+    def load(self):
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a record cut short by a crash
+                    continue
+                if 'mpot' in record:
+                    self.__pots[record['task']].append(record['mpot'])
+                elif 'done' in record:
+                    self.__done.add(record['task'])
+
+    def pots(self, key):
+        return self.__pots.get(key, [])
+
+    def is_done(self, key):
+        return key in self.__done
+
+    def __write(self, record, sync=False):
+        if self.__fd is None or self.__pid != os.getpid():
+            self.__fd = os.open(self.path,
+                                os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                                0o644)
+            self.__pid = os.getpid()
+        os.write(self.__fd, (json.dumps(record) + '\n').encode())
+        if sync:
+            os.fsync(self.__fd)
+
+    def record_pot(self, key, mpot):
+        self.__write({'task': key, 'mpot': snpproject.mpot_dump(mpot)})
+
+    def record_task(self, key, name):
+        self.__write({'task': key, 'done': name}, sync=True)
+        self.__done.add(key)
+
+    def attach(self, key, mtask):
+        # journal newly melted pots of mtask, keeping whatever pot_done
+        # callback is already set; resuming is mtask.restore(pots(key))
+        pot_done = mtask.pot_done
+
+        def on_pot_done(mpot, ready):
+            self.record_pot(key, mpot)
+            if pot_done is not None:
+                pot_done(mpot, ready)
+
+        mtask.pot_done = on_pot_done
+
+    def close(self):
+        if self.__fd is not None and self.__pid == os.getpid():
+            os.close(self.__fd)
+        self.__fd = None
@@ -0,0 +1,382 @@
+import os
+import json
+import struct
+
+import numpy as np
+import yaml
+
+from meltcurve import MeltCurve
+
+MPOT_FIELDS = ('t10_AB', 't10_ABm', 't10_AmBm', 't10_AmB',
+               't90_AB', 't90_ABm', 't90_AmBm', 't90_AmB')
+
+SEQUENCE_FIELDS = ('A', 'B', 'Am', 'Bm')
+
+TABLE_COLUMNS = ('name', 'position', 'length') + SEQUENCE_FIELDS + \
+                MPOT_FIELDS
+
+# Binary project: MAGIC, HEADER (version, metadata length), JSON metadata,
+# then 8 byte aligned column blocks whose offsets, dtypes and shapes are
+# listed in the metadata. Curves are an optional (pots, 4, points) block.
+MAGIC = b'SNPPROJ\n'
+VERSION = 1
+HEADER = struct.Struct('<IQ')
+ALIGN = 8
+
+
+class ProjectFormatError(Exception):
+    pass
+
+
+def conditions_dump(conditions):
+    return {'unafold_path': conditions.unafold_path,
+            'ram_disk': conditions.ram_disk,
+            't_min': conditions.t_min,
+            't_max': conditions.t_max,
+            't_increment': conditions.t_increment,
+            'a_conc': conditions.a_conc,
+            'Na_conc': conditions.Na_conc,
+            'Mg_conc': conditions.Mg_conc,
+            'backend': conditions.backend.name,}
+
+
+def mpot_dump(mpot):
+    dump = {'A': mpot.a,
+            'B': mpot.b,
+            'Am': mpot.am,
+            'Bm': mpot.bm,
+            'position': mpot.position,}
+    for field in MPOT_FIELDS:
+        dump[field] = getattr(mpot, field)
+    return dump
+
+
+def save_project(filename, dump):
+    with open(filename, 'w') as f:
+        print(yaml.dump(dump), file=f)
+
+
+def load_project(filename):
+    with open(filename, 'r') as f:
+        return yaml.safe_load(f.read())
+
+
+def table_rows(project):
+    for mpot in project.mpots():
+        yield [project.name, mpot['position'], len(mpot['A']),
+               mpot['A'], mpot['B'], mpot['Am'], mpot['Bm']] + \
+              [mpot[field] for field in MPOT_FIELDS]
+
+
+def format_row(row):
+    return '\t'.join('' if value is None else str(value) for value in row)
+
+
+def read_batch(filename):
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            name, sequence = line.split('\t')
+            yield name, sequence
+
+
+def batch_task(sequence, probe_min, probe_max):
+    return '{sequence}{min_p}->{max_p}'.format(sequence=sequence,
+                                               min_p=probe_min,
+                                               max_p=probe_max)
+
+
+def aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def temperature_column(values):
+    return np.array([np.nan if value is None else value for value in values],
+                    dtype='<f8')
+
+
+def curve_block(mpots):
+    grid = None
+    for mpot in mpots:
+        curve = mpot.curves[0]
+        if len(curve):
+            grid = curve.t
+            break
+    if grid is None:
+        return None, None
+    block = np.full((len(mpots), 4, len(grid)), np.nan, dtype='<f8')
+    for index, mpot in enumerate(mpots):
+        for pair, curve in enumerate(mpot.curves):
+            # only curves on the shared grid fit the block (adaptive
+            # curves each have their own)
+            if np.array_equal(curve.t, grid):
+                block[index, pair] = curve.conc
+    return np.array(grid, dtype='<f8'), block
+
+
+def mtask_columns(mtask):
+    # one pass over the pots, then one array per column
+    values = list(zip(*[(mpot.a, mpot.b, mpot.am, mpot.bm, mpot.position,
+                         mpot.t10_AB, mpot.t10_ABm, mpot.t10_AmBm,
+                         mpot.t10_AmB, mpot.t90_AB, mpot.t90_ABm,
+                         mpot.t90_AmBm, mpot.t90_AmB)
+                        for mpot in mtask.melting_pots]))
+    if not values:
+        values = [()] * (len(SEQUENCE_FIELDS) + 1 + len(MPOT_FIELDS))
+    sequences = values[:len(SEQUENCE_FIELDS)]
+    positions = values[len(SEQUENCE_FIELDS)]
+    ts = values[len(SEQUENCE_FIELDS) + 1:]
+    columns = {field: np.char.encode(np.array(column, dtype='U'), 'ascii')
+               for field, column in zip(SEQUENCE_FIELDS, sequences)}
+    columns['position'] = np.array(positions, dtype='<i4')
+    for field, column in zip(MPOT_FIELDS, ts):
+        columns[field] = temperature_column(column)
+    return columns
+
+
+# tab: (probe sequence, its own duplex, the mismatched duplex it competes with)
+TABS = {'A': ('A', 'AB', 'ABm'),
+        'B': ('B', 'AB', 'AmB'),
+        'Am': ('Am', 'AmBm', 'AmB'),
+        'Bm': ('Bm', 'AmBm', 'ABm'),}
+
+
+def tab_columns(columns, tab):
+    # columns: project columns (Project.column or mtask_columns), returns
+    # the per-probe values shown on a snpick tab, NaN where a t is missing
+    sequence, own, other = TABS[tab]
+    t10 = columns['t10_' + own]
+    t90 = columns['t90_' + own]
+    return {'sequence': columns[sequence],
+            'position': columns['position'],
+            'length': np.char.str_len(columns['A']),
+            't10': t10,
+            't90': t90,
+            'dt10': np.round(t10 - columns['t10_' + other], 1),
+            'dt90': np.round(t90 - columns['t90_' + other], 1),
+            'dt90t10': np.round(t90 - columns['t10_' + other], 1),}
+
+
+def filter_mask(tab, t10_min, t10_max, t90_min, t90_max,
+                dt10_min, dt90_min, dt90t10_min):
+    # snpick filter: t10/t90 inside their windows, each dt at least its
+    # minimum unless it is unknown or exactly 0
+    def delta_ok(dt, low):
+        return np.isnan(dt) | (dt == 0) | (dt >= low)
+
+    t10 = tab['t10']
+    t90 = tab['t90']
+    return (t10 >= t10_min) & (t10 <= t10_max) & \
+           (t90 >= t90_min) & (t90 <= t90_max) & \
+           delta_ok(tab['dt10'], dt10_min) & \
+           delta_ok(tab['dt90'], dt90_min) & \
+           delta_ok(tab['dt90t10'], dt90t10_min)
+
+
+class Project():
+    # Column oriented view of a project; binary files are memory mapped and
+    # only the columns (and curves) that are asked for are touched.
+    def __init__(self, meta, columns, grid=None, curves=None):
+        self.__meta = meta
+        self.__columns = columns
+        self.__grid = grid
+        self.__curves = curves
+
+    @classmethod
+    def from_mtask(cls, name, mtask, probe_min, probe_max, conditions,
+                   curves=True):
+        mpots = mtask.melting_pots
+        columns = mtask_columns(mtask)
+        grid, block = curve_block(mpots) if curves else (None, None)
+        return cls(cls.__new_meta(name, mtask.task, probe_min, probe_max,
+                                  conditions_dump(conditions), len(mpots)),
+                   columns, grid, block)
+
+    @classmethod
+    def from_dump(cls, dump):
+        mpots = dump['mpots']
+        columns = {field: np.array([mpot[field].encode('ascii')
+                                    for mpot in mpots], dtype='S')
+                   for field in SEQUENCE_FIELDS}
+        columns['position'] = np.array([int(mpot['position'])
+                                        for mpot in mpots], dtype='<i4')
+        for field in MPOT_FIELDS:
+            columns[field] = temperature_column(mpot[field] for mpot in mpots)
+        return cls(cls.__new_meta(dump['name'], dump['task'], dump['probeMin'],
+                                  dump['probeMax'], dump['conditions'],
+                                  len(mpots)),
+                   columns)
+
+    @staticmethod
+    def __new_meta(name, task, probe_min, probe_max, conditions, count):
+        return {'name': name,
+                'task': task,
+                'probeMin': str(probe_min),
+                'probeMax': str(probe_max),
+                'conditions': conditions,
+                'count': count,}
+
+    @classmethod
+    def read(cls, filename):
+        data = np.memmap(filename, dtype=np.uint8, mode='r')
+        if bytes(data[:len(MAGIC)]) != MAGIC:
+            raise ProjectFormatError(
+                '{filename}: not a binary project'.format(filename=filename))
+        version, meta_len = HEADER.unpack_from(data, len(MAGIC))
+        if version > VERSION:
+            raise ProjectFormatError(
+                '{filename}: format version {version} is newer than '
+                '{supported}'.format(filename=filename, version=version,
+                                     supported=VERSION))
+        start = len(MAGIC) + HEADER.size
+        meta = json.loads(bytes(data[start:start + meta_len]).decode())
+        base = aligned(start + meta_len)
+
+        def block(spec):
+            dtype = np.dtype(spec['dtype'])
+            offset = base + spec['offset']
+            size = dtype.itemsize * int(np.prod(spec['shape']))
+            return data[offset:offset + size].view(dtype) \
+                .reshape(spec['shape'])
+
+        columns = {name: (block, spec)
+                   for name, spec in meta.pop('columns').items()}
+        grid = meta.pop('grid', None)
+        curves = meta.pop('curves', None)
+        return cls(meta, columns,
+                   (block, grid) if grid else None,
+                   (block, curves) if curves else None)
+
+    def renamed(self, name):
+        return Project(dict(self.__meta, name=name), dict(self.__columns),
+                       self.__grid, self.__curves)
+
+    def save(self, filename):
+        # written next to filename and moved over it, so a project saved
+        # over the file it is memory mapped from stays readable
+        blocks = [(name, self.column(name)) for name in sorted(self.columns)]
+        if self.has_curves:
+            blocks += [('grid', self.grid), ('curves', self.__load('curves'))]
+        meta = dict(self.__meta, columns={})
+        offsets = []
+        offset = 0
+        for name, array in blocks:
+            spec = {'dtype': array.dtype.str,
+                    'shape': list(array.shape),
+                    'offset': offset}
+            if name in ('grid', 'curves'):
+                meta[name] = spec
+            else:
+                meta['columns'][name] = spec
+            offsets.append(offset)
+            offset = aligned(offset + array.nbytes)
+        meta_bytes = json.dumps(meta).encode()
+        base = aligned(len(MAGIC) + HEADER.size + len(meta_bytes))
+        temporary = '{filename}.{pid}.tmp'.format(filename=filename,
+                                                 pid=os.getpid())
+        try:
+            with open(temporary, 'wb') as f:
+                f.write(MAGIC)
+                f.write(HEADER.pack(VERSION, len(meta_bytes)))
+                f.write(meta_bytes)
+                for (name, array), offset in zip(blocks, offsets):
+                    f.write(b'\0' * (base + offset - f.tell()))
+                    f.write(np.ascontiguousarray(array).tobytes())
+            os.replace(temporary, filename)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+
+    def __load(self, name):
+        if name == 'grid':
+            value = self.__grid
+        elif name == 'curves':
+            value = self.__curves
+        else:
+            value = self.__columns[name]
+        if isinstance(value, tuple):
+            block, spec = value
+            value = block(spec)
+            if name == 'grid':
+                self.__grid = value
+            elif name == 'curves':
+                self.__curves = value
+            else:
+                self.__columns[name] = value
+        return value
+
+    @property
+    def name(self):
+        return self.__meta['name']
+
+    @property
+    def task(self):
+        return self.__meta['task']
+
+    @property
+    def probe_min(self):
+        return self.__meta['probeMin']
+
+    @property
+    def probe_max(self):
+        return self.__meta['probeMax']
+
+    @property
+    def conditions(self):
+        return self.__meta['conditions']
+
+    @property
+    def columns(self):
+        return list(self.__columns)
+
+    @property
+    def has_curves(self):
+        return self.__curves is not None
+
+    @property
+    def grid(self):
+        return self.__load('grid') if self.has_curves else None
+
+    def __len__(self):
+        return self.__meta['count']
+
+    def column(self, name):
+        return self.__load(name)
+
+    def __getitem__(self, name):
+        return self.__load(name)
+
+    def curves(self, index):
+        if not self.has_curves:
+            return None
+        block = self.__load('curves')[index]
+        if np.isnan(block).all():
+            return None
+        return [MeltCurve(self.grid, conc) for conc in block]
+
+    def mpots(self):
+        sequences = [self.column(field) for field in SEQUENCE_FIELDS]
+        positions = self.column('position')
+        ts = [self.column(field) for field in MPOT_FIELDS]
+        for index in range(len(self)):
+            mpot = {field: column[index].decode('ascii')
+                    for field, column in zip(SEQUENCE_FIELDS, sequences)}
+            mpot['position'] = str(positions[index])
+            for field, column in zip(MPOT_FIELDS, ts):
+                t = column[index]
+                mpot[field] = None if np.isnan(t) else float(t)
+            yield mpot
+
+    def dump(self):
+        return dict(self.__meta, mpots=list(self.mpots()))
+
+
+def open_project(filename):
+    with open(filename, 'rb') as f:
+        binary = f.read(len(MAGIC)) == MAGIC
+    if binary:
+        return Project.read(filename)
+    return Project.from_dump(load_project(filename))